@@ -1,14 +1,21 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import sqlite3
 from pathlib import Path
 import sys
 from logging_config import setup_logging, get_logger
+import asyncio
+import html
+import json
 import subprocess
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import numpy as np
 
@@ -18,14 +25,59 @@ logger = get_logger(__name__)
 load_dotenv()
 
 # Summarization utilities
-from summarise import split_text_into_chunks, summarise_chunk, MAX_CHUNKS
+from summarise import MODEL as SUMMARY_MODEL, PROMPT_VERSION, summarise_chunks
+import chunking
+import database
+import embedding_store
+import events
+import llm_client
+import job_queue
+import migrations
+import model_registry
+import speaker_index
+import summary_cache
 
 app = FastAPI()
-app.add_middleware(CORSMiddleware, allow_origins=["*"])
+app.add_middleware(CORSMiddleware, allow_origins=["*"], expose_headers=["X-Next-Cursor"])
 
 DB_PATH = Path(os.getenv("TRANSCRIPTS_DB", Path(__file__).parent / "transcripts.db"))
 AUDIO_SEGMENTS_DIR = Path(os.getenv("AUDIO_SEGMENTS", "/mnt/audio/audio_segments"))
 DASHBOARD_DIR = Path(__file__).parent / "dashboard"
+# Jobs processed concurrently when started from the dashboard
+API_JOB_WORKERS = int(os.getenv("API_JOB_WORKERS", "2"))
+# Recordings summarised at once by batch requests; their LLM calls also
+# share llm_client's process-wide LLM_CONCURRENCY limit
+SUMMARY_BATCH_WORKERS = int(os.getenv("SUMMARY_BATCH_WORKERS", "4"))
+# Finished batch handles kept for status polling
+MAX_TRACKED_BATCHES = 100
+# Upper bound on a page of the recordings list
+MAX_RECORDINGS_PAGE = int(os.getenv("MAX_RECORDINGS_PAGE", "1000"))
+# Upper bound on a page of search results
+MAX_SEARCH_RESULTS = 200
+# How often the event stream checks for new rows, and the idle keepalive
+EVENT_POLL_INTERVAL = 0.5
+EVENT_KEEPALIVE_SECONDS = 15
+
+@app.on_event("startup")
+def migrate_database():
+    """Create missing tables and indexes once instead of on every request."""
+    conn = database.get_connection(DB_PATH)
+    migrations.migrate(conn)
+    summary_cache.prune_stale(conn, SUMMARY_MODEL, PROMPT_VERSION)
+
+
+@app.on_event("startup")
+def warm_up_models():
+    """Preload the models named in ``MODEL_WARMUP`` (none by default)."""
+    model_registry.warm_up()
+
+
+@app.on_event("shutdown")
+def close_database():
+    JOB_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    SUMMARY_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    database.close_connections()
+
 
 # Static mounts
 app.mount("/dashboard", StaticFiles(directory=DASHBOARD_DIR, html=True), name="dashboard")
@@ -68,127 +120,287 @@ def transcript_page():
 
 
 @app.get("/api/recordings")
-def get_recordings():
-    conn = sqlite3.connect(DB_PATH)
+def get_recordings(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=MAX_RECORDINGS_PAGE),
+    cursor: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    has_summary: bool | None = None,
+    speaker_id: str | None = None,
+):
+    """List recordings newest first, optionally one page at a time.
+
+    Pages are keyed on ``(datetime, id)``: pass the ``X-Next-Cursor``
+    response header back as ``cursor`` to fetch the next page.  Segment
+    counts and summary flags are maintained by triggers, so each page costs
+    an index range scan regardless of archive size.
+    """
+    where, params = [], {}
+    if cursor:
+        before_dt, _, before_id = cursor.rpartition("|")
+        try:
+            params.update(before_dt=before_dt, before_id=int(before_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        where.append("(r.datetime, r.id) < (:before_dt, :before_id)")
+    if date_from:
+        where.append("r.datetime >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        # Recording datetimes look like 2024-01-31_09-15, so a bare date
+        # must include the whole day
+        where.append("r.datetime <= :date_to")
+        params["date_to"] = date_to + "\uffff"
+    if has_summary is not None:
+        where.append("r.has_summary = :has_summary")
+        params["has_summary"] = int(has_summary)
+    if speaker_id:
+        where.append("r.id IN (SELECT recording_id FROM segments WHERE speaker_id = :speaker_id)")
+        params["speaker_id"] = speaker_id
+    params["limit"] = -1 if limit is None else limit + 1
+
+    conn = database.get_connection(DB_PATH)
     conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    # Ensure summaries table exists for summary availability flag
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS summaries (
-            recording_id INTEGER PRIMARY KEY,
-            summary TEXT NOT NULL
-        )
-        """
-    )
+    rows = conn.execute(
+        f"""
+        SELECT r.id, r.filename, r.datetime, r.duration_sec, r.segment_count, r.has_summary
+        FROM recordings r
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY r.datetime DESC, r.id DESC
+        LIMIT :limit
+        """,
+        params,
+    ).fetchall()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        if rows:
+            response.headers["X-Next-Cursor"] = f"{rows[-1]['datetime']}|{rows[-1]['id']}"
+    return [dict(row) for row in rows]
 
-    query = """
-    SELECT r.id,
-           r.filename,
-           r.datetime,
-           r.duration_sec,
-           COUNT(s.id) AS segment_count,
-           CASE WHEN EXISTS(
-             SELECT 1 FROM summaries su WHERE su.recording_id = r.id
-           ) THEN 1 ELSE 0 END AS has_summary
-    FROM recordings r
-    LEFT JOIN segments s ON s.recording_id = r.id
-    GROUP BY r.id
-    ORDER BY r.datetime DESC
+
+def _summary_plan(conn, recording_id: int):
+    """Chunks and cache key for a recording, or ``None`` without segments."""
+    chunks = list(chunking.chunk_recording(conn, recording_id))
+    if not chunks:
+        return None
+    # The chunks are the rendered transcript, so they key the whole summary
+    return chunks, summary_cache.content_key("\x1e".join(chunks), SUMMARY_MODEL, PROMPT_VERSION)
+
+
+def _summarize(recording_id: int) -> bool:
+    """Summarise ``recording_id``; returns whether the stored one was current.
+
+    Raises ``LookupError`` if the recording has no segments.
     """
-    rows = cursor.execute(query).fetchall()
-    return [dict(row) for row in rows]
+    conn = database.get_connection(DB_PATH)
+    plan = _summary_plan(conn, recording_id)
+    if plan is None:
+        raise LookupError(recording_id)
+    chunks, key = plan
+    if summary_cache.get_summary(conn, recording_id, key) is not None:
+        return True
+
+    cache = summary_cache.ChunkCache(conn, SUMMARY_MODEL, PROMPT_VERSION)
+    full_summary = summarise_chunks(chunks, cache=cache)
+    logger.info(
+        f"📝 Summarised recording {recording_id}: {cache.hits} cached call(s), {cache.misses} new"
+    )
+
+    summary_cache.store_summary(conn, recording_id, full_summary, key, SUMMARY_MODEL, PROMPT_VERSION)
+    events.publish(conn, "summary.completed", recording_id=recording_id)
+    conn.commit()
+    return False
 
 
 @app.post("/api/recordings/{recording_id}/summarize")
 def summarize_recording(recording_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    """Summarise a recording, reusing cached work for unchanged text.
 
-    # Ensure summaries table exists
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS summaries (
-            recording_id INTEGER PRIMARY KEY,
-            summary TEXT NOT NULL
-        )
-        """
-    )
-    rows = cursor.execute(
-        """
-        SELECT s.start_time, sp.label AS speaker_label, s.transcript
-        FROM segments s
-        LEFT JOIN speakers sp ON sp.id = s.speaker_id
-        WHERE s.recording_id = ?
-        ORDER BY s.start_time ASC
-        """,
-        (recording_id,),
-    ).fetchall()
-    if not rows:
-        conn.close()
+    A byte-identical transcript (same prompt version and model) returns the
+    stored summary without calling the LLM; otherwise only chunks whose
+    text changed are re-summarised.
+    """
+    try:
+        cached = _summarize(recording_id)
+    except LookupError:
         raise HTTPException(status_code=404, detail="Recording not found or no segments")
+    return {"status": "completed", "cached": cached}
 
-    text = "\n".join(
-        f"[{row['speaker_label'] or ''}] {row['transcript']}" for row in rows
-    )
-    chunks = split_text_into_chunks(text)
-    summaries = [summarise_chunk(chunk) for chunk in chunks[:MAX_CHUNKS]]
-    full_summary = "\n\n---\n\n".join(summaries)
 
-    cursor.execute(
-        "REPLACE INTO summaries (recording_id, summary) VALUES (?, ?)",
-        (recording_id, full_summary),
-    )
-    conn.commit()
-    conn.close()
-    return {"status": "completed"}
+# Batch summaries run here, off the request threads
+SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=SUMMARY_BATCH_WORKERS, thread_name_prefix="summary")
+_batches: dict[str, dict] = {}
+_batches_lock = threading.Lock()
+
+
+class SummaryBatch(BaseModel):
+    recording_ids: list[int]
+
+
+def _batch_status(batch: dict) -> dict:
+    with _batches_lock:
+        recordings = [{"recording_id": rid, **item} for rid, item in batch["recordings"].items()]
+    running = any(item["status"] in ("queued", "running") for item in recordings)
+    return {
+        "batch_id": batch["batch_id"],
+        "status": "running" if running else "completed",
+        "status_url": f"/api/recordings/batch_summarize/{batch['batch_id']}",
+        "created_at": batch["created_at"],
+        "recordings": recordings,
+    }
+
+
+def _set_batch_item(batch: dict, recording_id: int, **item) -> None:
+    with _batches_lock:
+        batch["recordings"][recording_id] = item
+
+
+def _run_batch_summary(batch: dict, recording_id: int) -> None:
+    _set_batch_item(batch, recording_id, status="running")
+    try:
+        status = "current" if _summarize(recording_id) else "completed"
+    except LookupError:
+        status = "not_found"
+    except Exception as e:
+        logger.exception(f"❌ Batch summary failed for recording {recording_id}")
+        _set_batch_item(batch, recording_id, status="failed", error=str(e) or type(e).__name__)
+        conn = database.get_connection(DB_PATH)
+        conn.rollback()
+        events.publish(conn, "summary.failed", recording_id=recording_id, batch_id=batch["batch_id"])
+        conn.commit()
+        return
+    _set_batch_item(batch, recording_id, status=status)
+    if status != "completed":
+        # Nothing was written, but batch pages still wait for an event
+        conn = database.get_connection(DB_PATH)
+        events.publish(
+            conn, "summary.skipped", recording_id=recording_id, batch_id=batch["batch_id"], status=status
+        )
+        conn.commit()
+
+
+@app.post("/api/recordings/batch_summarize", status_code=202)
+def batch_summarize(payload: SummaryBatch):
+    """Summarise several recordings in the background.
+
+    Every recording is queued and runs ``SUMMARY_BATCH_WORKERS`` at a time;
+    the workers report those whose summary is already current as ``current``
+    and those without segments as ``not_found``.  Poll ``status_url`` or
+    listen for ``summary.*`` events.
+    """
+    batch = {
+        "batch_id": uuid.uuid4().hex[:12],
+        "created_at": time.time(),
+        "recordings": {rid: {"status": "queued"} for rid in dict.fromkeys(payload.recording_ids)},
+    }
+    with _batches_lock:
+        _batches[batch["batch_id"]] = batch
+        # Dicts keep insertion order, so the oldest handles go first
+        while len(_batches) > MAX_TRACKED_BATCHES:
+            del _batches[next(iter(_batches))]
+    status = _batch_status(batch)
+    for recording_id in dict.fromkeys(payload.recording_ids):
+        SUMMARY_EXECUTOR.submit(_run_batch_summary, batch, recording_id)
+    return status
+
+
+@app.get("/api/recordings/batch_summarize/{batch_id}")
+def get_batch_summary_status(batch_id: str):
+    with _batches_lock:
+        batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return _batch_status(batch)
 
 
 @app.get("/api/recordings/{recording_id}/summary")
 def get_summary(recording_id: int):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.get_connection(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS summaries (
-            recording_id INTEGER PRIMARY KEY,
-            summary TEXT NOT NULL
-        )
-        """
-    )
     row = cursor.execute(
         "SELECT summary FROM summaries WHERE recording_id = ?",
         (recording_id,),
     ).fetchone()
-    conn.close()
     if not row:
         raise HTTPException(status_code=404, detail="Summary not found")
     return {"summary": row[0]}
 
 
+# Jobs started from the dashboard run here, off the request threads
+JOB_EXECUTOR = ThreadPoolExecutor(max_workers=API_JOB_WORKERS, thread_name_prefix="job")
+_submitted: set[int] = set()
+_submitted_lock = threading.Lock()
+
+_JOB_COLUMNS = """
+    id, file_path, status, created_at, attempts, last_error, next_attempt_at,
+    stage, stage_started_at, progress_done, progress_total, started_at, finished_at
+"""
+
+
+def _job_status(row) -> dict:
+    job = dict(row)
+    progress = job_queue.describe_progress(job)
+    for key in ("stage_started_at", "progress_done", "progress_total", "started_at", "finished_at"):
+        job.pop(key)
+    job.update(progress)
+    return job
+
+
 @app.get("/api/jobs")
 def get_jobs():
-    """Return all jobs with their status and creation time."""
-    conn = sqlite3.connect(DB_PATH)
+    """Return all jobs with their status, retry state and progress."""
+    conn = database.get_connection(DB_PATH)
     conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    rows = cursor.execute(
-        "SELECT id, file_path, status, created_at FROM jobs ORDER BY created_at DESC"
-    ).fetchall()
-    return [dict(row) for row in rows]
+    rows = conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs ORDER BY created_at DESC").fetchall()
+    return [_job_status(row) for row in rows]
+
+
+@app.get("/api/jobs/{job_id}/status")
+def get_job_status(job_id: int):
+    """Stage, segments done/total, elapsed seconds and ETA for one job."""
+    conn = database.get_connection(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(row)
+
+
+def _submit_job(job_id: int) -> dict:
+    """Queue ``job_id`` on the executor and return a handle for polling."""
+    conn = database.get_connection(DB_PATH)
+    with _submitted_lock:
+        if job_id not in _submitted:
+            if not job_queue.requeue(conn, job_id):
+                raise ValueError("Job not found")
+            _submitted.add(job_id)
+            JOB_EXECUTOR.submit(_run_job, job_id)
+    return {"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}/status"}
+
+
+def _run_job(job_id: int) -> None:
+    try:
+        _process_job(job_id)
+    except job_queue.JobLeasedError:
+        # A pipeline worker picked the requeued job up first
+        logger.info(f"⏭️ Job {job_id} was claimed by another worker")
+    except Exception:
+        logger.exception(f"❌ Job {job_id} failed")
+    finally:
+        with _submitted_lock:
+            _submitted.discard(job_id)
 
 
-@app.post("/api/jobs/{job_id}/process")
+@app.post("/api/jobs/{job_id}/process", status_code=202)
 def process_job(job_id: int):
-    """Process a single job by ID."""
+    """Queue a single job and return immediately; poll ``status_url``."""
     try:
-        result = _process_job(job_id)
+        return _submit_job(job_id)
     except ValueError:
         raise HTTPException(status_code=404, detail="Job not found")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    return {"status": "completed", "recording_id": result.get("recording_id")}
+    except job_queue.JobLeasedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 class JobBatch(BaseModel):
@@ -196,49 +408,181 @@ class JobBatch(BaseModel):
 
 
 def _process_job(job_id: int):
-    from transcribe_and_split import transcribe_and_split
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    row = cursor.execute("SELECT file_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
-    if not row:
-        conn.close()
-        raise ValueError("Job not found")
-    file_path = row[0]
+    from transcribe_and_split import is_ingested, transcribe_and_split
+
+    conn = database.get_connection(DB_PATH)
+    worker_id = job_queue.default_worker_id()
+    # If a pipeline worker already ran the requeued job, it is no longer due
+    job = job_queue.claim(conn, worker_id, job_id=job_id)
+    if job is None:
+        logger.info(f"⏭️ Job {job_id} is no longer due")
+        return None
+    file_path = job[1]
     try:
-        cursor.execute("UPDATE jobs SET status = 'processing' WHERE id = ?", (job_id,))
-        conn.commit()
-        recording_id = transcribe_and_split(Path(file_path))
-        if recording_id is not None:
-            run_speaker_identification(recording_id)
-        cursor.execute("UPDATE jobs SET status = 'completed' WHERE id = ?", (job_id,))
-        conn.commit()
-        return {"job_id": job_id, "recording_id": recording_id}
+        with job_queue.lease(DB_PATH, job_id, worker_id) as report:
+            recording_id = transcribe_and_split(Path(file_path), progress=report)
+            if recording_id is None:
+                # transcribe_and_split logs its own errors and returns None;
+                # only an already-ingested file counts as success
+                if not is_ingested(conn, Path(file_path)):
+                    raise RuntimeError("Transcription failed")
+            else:
+                report("speakers")
+                run_speaker_identification(recording_id)
     except Exception as e:
-        cursor.execute("UPDATE jobs SET status = 'error' WHERE id = ?", (job_id,))
-        conn.commit()
+        job_queue.fail(conn, job_id, worker_id, str(e) or type(e).__name__)
         raise e
-    finally:
-        conn.close()
+    job_queue.complete(conn, job_id, worker_id)
+    return {"job_id": job_id, "recording_id": recording_id}
 
 
-@app.post("/api/jobs/batch")
+@app.post("/api/jobs/batch", status_code=202)
 def process_jobs_batch(batch: JobBatch):
-    """Process multiple jobs in sequence."""
-    processed = []
+    """Queue several jobs; they run concurrently up to ``API_JOB_WORKERS``."""
+    queued = []
     errors = []
     for job_id in batch.job_ids:
         try:
-            processed.append(_process_job(job_id))
+            queued.append(_submit_job(job_id))
         except ValueError:
             errors.append({"job_id": job_id, "error": "not found"})
-        except Exception as e:
+        except job_queue.JobLeasedError as e:
             errors.append({"job_id": job_id, "error": str(e)})
-    return {"processed": processed, "errors": errors}
-            
+    return {"queued": queued, "errors": errors}
+
+
+@app.get("/api/llm/metrics")
+def get_llm_metrics():
+    """Call, cache, retry, token and latency totals for this process."""
+    return llm_client.metrics()
+
+
+def _read_events(last_id: int, types: list[str] | None):
+    return events.read_since(database.get_connection(DB_PATH), last_id, types)
+
+
+@app.get("/api/events")
+async def stream_events(request: Request, since: int | None = None, types: str | None = None):
+    """Server-sent stream of job, recording, speaker and summary events.
+
+    Resumes after ``Last-Event-ID`` (sent by ``EventSource`` when it
+    reconnects) or ``since``; otherwise only new events are sent.  ``types``
+    is a comma-separated list of types or prefixes, e.g. ``job,summary``.
+    """
+    wanted = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    header = request.headers.get("last-event-id", "")
+    last_id = int(header) if header.isdigit() else since
+    if last_id is None:
+        last_id = await asyncio.to_thread(lambda: events.latest_id(database.get_connection(DB_PATH)))
+
+    async def stream():
+        nonlocal last_id
+        idle = 0.0
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            batch, last_id = await asyncio.to_thread(_read_events, last_id, wanted)
+            for event in batch:
+                data = json.dumps(event["data"])
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+            if batch:
+                idle = 0.0
+                continue
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+            idle += EVENT_POLL_INTERVAL
+            if idle >= EVENT_KEEPALIVE_SECONDS:
+                # Keeps proxies from closing an idle stream
+                idle = 0.0
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _quote_terms(q: str) -> str:
+    """Treat every word as a literal FTS5 string."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def _highlight(snippet: str) -> str:
+    # Markers are escaped along with the transcript text, then turned into tags
+    return html.escape(snippet).replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+
+@app.get("/api/search")
+def search_segments(
+    response: Response,
+    q: str,
+    speaker_id: str | None = None,
+    recording_id: int | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    limit: int = 50,
+    cursor: str | None = None,
+):
+    """Full-text search over segment transcripts, best matches first.
+
+    ``q`` accepts FTS5 syntax (``"exact phrase"``, ``prefix*``, ``OR``);
+    input that does not parse is searched as plain words.  Snippets are
+    HTML-escaped with matches wrapped in ``<mark>``.  Pass the
+    ``X-Next-Cursor`` response header back as ``cursor`` for the next page.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Empty query")
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    where, params = ["segments_fts MATCH :q"], {"limit": limit + 1, "offset": offset}
+    if speaker_id:
+        where.append("s.speaker_id = :speaker_id")
+        params["speaker_id"] = speaker_id
+    if recording_id is not None:
+        where.append("s.recording_id = :recording_id")
+        params["recording_id"] = recording_id
+    if date_from:
+        where.append("r.datetime >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        where.append("r.datetime <= :date_to")
+        params["date_to"] = date_to + "\uffff"
+    sql = f"""
+        SELECT s.id AS segment_id, s.recording_id, r.filename, r.datetime,
+               s.start_time, s.end_time, s.speaker_id, sp.label AS speaker_label,
+               snippet(segments_fts, 0, char(2), char(3), '…', 16) AS snippet,
+               bm25(segments_fts) AS score
+        FROM segments_fts
+        JOIN segments s ON s.id = segments_fts.rowid
+        JOIN recordings r ON r.id = s.recording_id
+        LEFT JOIN speakers sp ON sp.id = s.speaker_id
+        WHERE {" AND ".join(where)}
+        ORDER BY score, s.id
+        LIMIT :limit OFFSET :offset
+    """
+
+    conn = database.get_connection(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(sql, {**params, "q": q}).fetchall()
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            raise HTTPException(status_code=501, detail="Full-text search is not available")
+        # Stray quotes or operators; fall back to plain words
+        rows = conn.execute(sql, {**params, "q": _quote_terms(q)}).fetchall()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(offset + limit)
+    return [{**dict(row), "snippet": _highlight(row["snippet"] or "")} for row in rows]
+
+
 @app.get("/api/segments/{recording_id}")
 def get_segments(recording_id: int):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.get_connection(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
@@ -256,7 +600,7 @@ def get_segments(recording_id: int):
 
 @app.delete("/api/recordings/{recording_id}")
 def delete_recording(recording_id: int):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.get_connection(DB_PATH)
     cursor = conn.cursor()
 
     cursor.execute("SELECT filename FROM recordings WHERE id = ?", (recording_id,))
@@ -273,20 +617,23 @@ def delete_recording(recording_id: int):
             except Exception as e:
                 print(f"⚠️ Failed to delete {path}: {e}")
 
+    embedding_store.delete_recording_embeddings(cursor, recording_id)
     cursor.execute("DELETE FROM segments WHERE recording_id = ?", (recording_id,))
+    cursor.execute("DELETE FROM speaker_label_cache WHERE recording_id = ?", (recording_id,))
     cursor.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+    events.publish(conn, "recording.deleted", id=recording_id)
     conn.commit()
-    conn.close()
 
     return {"status": "deleted", "id": recording_id}
 
 
 def run_speaker_identification(recording_id: int):
-    """Invoke the speaker identification script for a given recording."""
-    script = Path(__file__).parent / "scripts" / "speaker_identification.py"
+    """Run speaker identification in-process so resident models are reused."""
+    import speaker_identification
+
     try:
-        subprocess.run([sys.executable, str(script), str(recording_id)], check=True)
-    except subprocess.CalledProcessError as exc:
+        speaker_identification.main(recording_id)
+    except Exception as exc:
         print(f"⚠️ Speaker identification failed: {exc}")
 
 
@@ -317,6 +664,9 @@ class SpeakerUpdate(BaseModel):
 
 class SegmentSpeakerUpdate(BaseModel):
     speaker_id: str
+    # Cosine distance below which other segments are suggested as candidates
+    threshold: float = 0.25
+    limit: int | None = None
 
 
 class SpeakerMerge(BaseModel):
@@ -325,81 +675,62 @@ class SpeakerMerge(BaseModel):
 
 
 @app.get("/api/speakers")
-def get_speakers():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS speaker_samples (
-            speaker_id TEXT,
-            segment_id INTEGER,
-            FOREIGN KEY (speaker_id) REFERENCES speakers(id),
-            FOREIGN KEY (segment_id) REFERENCES segments(id)
-        )
+def get_speakers(limit: int | None = None, offset: int = 0, limit_samples: int | None = None):
+    """List speakers with their most recent samples in a single query.
+
+    ``limit``/``offset`` page through speakers ordered by id and
+    ``limit_samples`` caps the samples returned per speaker (0 for none).
+    """
+    conn = database.get_connection(DB_PATH)
+    rows = conn.execute(
         """
-    )
-    rows = cursor.execute("SELECT id, label FROM speakers ORDER BY id").fetchall()
-    speakers = []
-    for row in rows:
-        samples = cursor.execute(
-            """
-            SELECT s.id, s.embedding_path
+        WITH page AS (
+            SELECT id, label FROM speakers ORDER BY id LIMIT :limit OFFSET :offset
+        ),
+        samples AS (
+            SELECT sp.speaker_id, s.id AS segment_id, s.embedding_path,
+                   ROW_NUMBER() OVER (PARTITION BY sp.speaker_id ORDER BY sp.rowid DESC) AS n
             FROM speaker_samples sp
+            JOIN page p ON p.id = sp.speaker_id
             JOIN segments s ON s.id = sp.segment_id
-            WHERE sp.speaker_id = ?
-            ORDER BY sp.rowid DESC
-            """,
-            (row["id"],),
-        ).fetchall()
-        speakers.append(
-            {
-                "id": row["id"],
-                "label": row["label"],
-                "samples": [
-                    {"id": s[0], "file": Path(s[1]).name if s[1] else None}
-                    for s in samples
-                ],
-            }
         )
-    conn.close()
-    return speakers
-
-
-@app.post("/api/speakers/{speaker_id}")
-def update_speaker(speaker_id: str, payload: SpeakerUpdate):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE speakers SET label = ? WHERE id = ?", (payload.label, speaker_id)
+        SELECT p.id, p.label, x.segment_id, x.embedding_path
+        FROM page p
+        LEFT JOIN samples x
+          ON x.speaker_id = p.id AND (:limit_samples < 0 OR x.n <= :limit_samples)
+        ORDER BY p.id, x.n
+        """,
+        {
+            "limit": -1 if limit is None else limit,
+            "offset": offset,
+            "limit_samples": -1 if limit_samples is None else limit_samples,
+        },
     )
-    conn.commit()
-    conn.close()
-    return {"status": "ok"}
+    speakers = []
+    for speaker_id, label, segment_id, path in rows:
+        if not speakers or speakers[-1]["id"] != speaker_id:
+            speakers.append({"id": speaker_id, "label": label, "samples": []})
+        if segment_id is not None:
+            speakers[-1]["samples"].append(
+                {"id": segment_id, "file": Path(path).name if path else None}
+            )
+    return speakers
 
 
 @app.post("/api/speakers/merge")
 def merge_speakers(payload: SpeakerMerge):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.get_connection(DB_PATH)
     cursor = conn.cursor()
     cursor.execute(
         "UPDATE segments SET speaker_id = ? WHERE speaker_id = ?",
         (payload.target_id, payload.source_id),
     )
+    # Samples the target already has would violate the unique index
     cursor.execute(
-        "UPDATE speaker_samples SET speaker_id = ? WHERE speaker_id = ?",
+        "UPDATE OR IGNORE speaker_samples SET speaker_id = ? WHERE speaker_id = ?",
         (payload.target_id, payload.source_id),
     )
-    cursor.execute(
-        """
-        DELETE FROM speaker_samples
-        WHERE rowid NOT IN (
-            SELECT MIN(rowid)
-            FROM speaker_samples
-            GROUP BY speaker_id, segment_id
-        )
-        """
-    )
+    cursor.execute("DELETE FROM speaker_samples WHERE speaker_id = ?", (payload.source_id,))
     cursor.execute(
         "SELECT label FROM speakers WHERE id = ?",
         (payload.target_id,),
@@ -417,60 +748,136 @@ def merge_speakers(payload: SpeakerMerge):
                 (source_row[0], payload.target_id),
             )
     cursor.execute("DELETE FROM speakers WHERE id = ?", (payload.source_id,))
+    events.publish(conn, "speakers.assigned", merged_from=payload.source_id, speaker_id=payload.target_id)
+    conn.commit()
+    # Drops the source centroid and recomputes the target from its new samples
+    speaker_index.load_index(conn, compute_missing=False)
+    return {"status": "ok"}
+
+
+@app.post("/api/speakers/{speaker_id}")
+def update_speaker(speaker_id: str, payload: SpeakerUpdate):
+    conn = database.get_connection(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE speakers SET label = ? WHERE id = ?", (payload.label, speaker_id)
+    )
     conn.commit()
-    conn.close()
     return {"status": "ok"}
 
 
+def _add_speaker_sample(cursor, speaker_id: str, segment_id: int, max_samples: int = 10):
+    """Record a manually assigned segment as a sample until the speaker has enough."""
+    cursor.execute("DELETE FROM speaker_samples WHERE segment_id = ? AND speaker_id != ?", (segment_id, speaker_id))
+    count, present = cursor.execute(
+        "SELECT COUNT(*), COALESCE(SUM(segment_id = ?), 0) FROM speaker_samples WHERE speaker_id = ?",
+        (segment_id, speaker_id),
+    ).fetchone()
+    if not present and count < max_samples:
+        cursor.execute(
+            "INSERT INTO speaker_samples (speaker_id, segment_id) VALUES (?, ?)",
+            (speaker_id, segment_id),
+        )
+
+
+@app.get("/api/recordings/{recording_id}/speaker_matches")
+def get_speaker_matches(recording_id: int, k: int = 3):
+    """Nearest known speakers and cosine distances for each segment of a recording.
+
+    Uses stored embeddings and the speaker centroid index, so match
+    thresholds can be tuned without re-running the encoder.
+    """
+    conn = database.get_connection(DB_PATH)
+    rows = conn.execute(
+        "SELECT id, speaker_id FROM segments WHERE recording_id = ? ORDER BY start_time ASC",
+        (recording_id,),
+    ).fetchall()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Recording not found or no segments")
+    embeddings = embedding_store.get_embeddings(conn, [r[0] for r in rows], compute_missing=False)
+    index = speaker_index.load_index(conn, compute_missing=False)
+    labels = dict(conn.execute("SELECT id, label FROM speakers").fetchall())
+
+    rows = [r for r in rows if r[0] in embeddings]
+    if not rows:
+        return []
+    ids, dists = index.query(np.array([embeddings[r[0]] for r in rows]), k=k)
+    return [
+        {
+            "segment_id": seg_id,
+            "speaker_id": speaker_id,
+            "matches": [
+                {"speaker_id": sid, "label": labels.get(sid), "distance": round(float(d), 4)}
+                for sid, d in zip(ids[i], dists[i])
+            ],
+        }
+        for i, (seg_id, speaker_id) in enumerate(rows)
+    ]
+
+
+def _rank_similar_segments(conn, recording_id: int, segment_id: int, threshold: float, limit: int | None):
+    """Segments of ``recording_id`` closest to ``segment_id``, nearest first."""
+    # Stored vectors only; segments the pipeline has not embedded are skipped
+    embeddings = embedding_store.get_recording_embeddings(conn, recording_id, compute_missing=False)
+    target = embeddings.get(segment_id)
+    if target is None:
+        return []
+    ids = np.array([sid for sid in embeddings if sid != segment_id])
+    if len(ids) == 0:
+        return []
+    matrix = np.stack([embeddings[sid] for sid in ids])
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10
+    dists = 1 - matrix @ (target / (np.linalg.norm(target) + 1e-10))
+
+    keep = np.flatnonzero(dists < threshold)
+    keep = keep[np.argsort(dists[keep])][:limit]
+    speakers = dict(
+        conn.execute(
+            "SELECT id, speaker_id FROM segments WHERE recording_id = ?", (recording_id,)
+        ).fetchall()
+    )
+    return [
+        {
+            "id": int(ids[i]),
+            "distance": round(float(dists[i]), 4),
+            "speaker_id": speakers.get(int(ids[i])),
+        }
+        for i in keep
+    ]
+
+
 @app.post("/api/segments/{segment_id}/speaker")
 def update_segment_speaker(segment_id: int, payload: SegmentSpeakerUpdate):
     """Assign a segment to a speaker and suggest similar segments."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.get_connection(DB_PATH)
     cursor = conn.cursor()
     cursor.execute(
         "UPDATE segments SET speaker_id = ? WHERE id = ?",
         (payload.speaker_id, segment_id),
     )
+    _add_speaker_sample(cursor, payload.speaker_id, segment_id)
+    events.publish(conn, "speakers.assigned", segment_id=segment_id, speaker_id=payload.speaker_id)
     conn.commit()
+    try:
+        speaker_index.load_index(conn, compute_missing=False)
+    except Exception:
+        logger.exception("⚠️ Failed to update speaker index")
 
     row = cursor.execute(
-        "SELECT embedding_path, recording_id FROM segments WHERE id = ?",
+        "SELECT recording_id FROM segments WHERE id = ?",
         (segment_id,),
     ).fetchone()
 
-    candidates: list[int] = []
-    if row and row[0]:
-        emb_path = Path(row[0])
-        if not emb_path.is_absolute():
-            emb_path = AUDIO_SEGMENTS_DIR / emb_path.name
+    ranked: list[dict] = []
+    if row:
         try:
-            from resemblyzer import VoiceEncoder, preprocess_wav
-
-            encoder = VoiceEncoder()
-            wav = preprocess_wav(str(emb_path))
-            target_emb = encoder.embed_utterance(wav)
-
-            others = cursor.execute(
-                "SELECT id, embedding_path FROM segments WHERE recording_id = ? AND id != ?",
-                (row[1], segment_id),
-            ).fetchall()
-
-            for sid, path in others:
-                if not path:
-                    continue
-                path = Path(path)
-                if not path.is_absolute():
-                    path = AUDIO_SEGMENTS_DIR / path.name
-                try:
-                    wav2 = preprocess_wav(str(path))
-                    emb2 = encoder.embed_utterance(wav2)
-                    dist = 1 - float(np.dot(target_emb, emb2) / (np.linalg.norm(target_emb) * np.linalg.norm(emb2) + 1e-10))
-                    if dist < 0.25:
-                        candidates.append(sid)
-                except Exception:
-                    continue
+            ranked = _rank_similar_segments(
+                conn, row[0], segment_id, payload.threshold, payload.limit
+            )
         except Exception:
-            pass
-
-    conn.close()
-    return {"status": "ok", "candidates": candidates}
+            logger.exception("⚠️ Failed to compute candidate segments")
+    return {
+        "status": "ok",
+        "candidates": [c["id"] for c in ranked],
+        "ranked": ranked,
+    }
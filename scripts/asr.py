@@ -0,0 +1,194 @@
+"""Whisper transcription of VAD segments.
+
+Whisper pads every input to a 30 second window, so consecutive short
+segments are first packed into shared windows (separated by short silence
+spacers), transcribed once with word timestamps and the words mapped back
+onto the segments they fall in.  Segments that are left on their own and
+fit in one window are decoded in batches:
+their log-mel spectrograms are stacked and passed to ``whisper.decode`` in a
+single call.  Longer segments, failed batches and results that look like
+decoding failures fall back to ``model.transcribe`` one segment at a time.
+"""
+import bisect
+import os
+from typing import Callable
+
+import numpy as np
+
+from common import setup_logging, get_logger
+
+setup_logging()
+logger = get_logger(__name__)
+
+# 0 or 1 disables batching and uses the per-segment path
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+LANGUAGE = "en"
+PACK_SEGMENTS = os.getenv("WHISPER_PACK_SEGMENTS", "1").lower() not in ("0", "false", "no")
+SAMPLE_RATE = 16000
+WINDOW_SECONDS = 30.0
+SPACER_SECONDS = 0.5
+
+# Same thresholds whisper.transcribe uses to decide a decode needs retrying
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+def transcribe_one(model, samples: np.ndarray) -> str:
+    """Transcribe a single segment with Whisper's full fallback logic."""
+    return model.transcribe(samples, verbose=False, language=LANGUAGE)["text"].strip()
+
+
+def transcribe_batch(model, segments: list[np.ndarray]) -> list[str | None]:
+    """Decode segments of at most 30 s in one batched forward pass.
+
+    Returns ``None`` for results that should be retried individually.
+    """
+    import torch
+    import whisper
+
+    mels = torch.stack(
+        [
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(seg), n_mels=model.dims.n_mels)
+            for seg in segments
+        ]
+    ).to(model.device)
+    options = whisper.DecodingOptions(
+        language=LANGUAGE,
+        without_timestamps=True,
+        fp16=model.device.type == "cuda",
+    )
+    results = whisper.decode(model, mels, options)
+    texts: list[str | None] = []
+    for r in results:
+        if r.no_speech_prob > NO_SPEECH_THRESHOLD and r.avg_logprob < LOGPROB_THRESHOLD:
+            texts.append("")
+        elif r.compression_ratio > COMPRESSION_RATIO_THRESHOLD or r.avg_logprob < LOGPROB_THRESHOLD:
+            texts.append(None)
+        else:
+            texts.append(r.text.strip())
+    return texts
+
+
+def pack_segments(
+    segments: list[np.ndarray],
+    window: float = WINDOW_SECONDS,
+    spacer: float = SPACER_SECONDS,
+) -> list[list[int]]:
+    """Group consecutive segment indices so each group fits in one window."""
+    limit = int(window * SAMPLE_RATE)
+    gap = int(spacer * SAMPLE_RATE)
+    groups: list[list[int]] = []
+    used = 0
+    for i, seg in enumerate(segments):
+        if groups and used + gap + len(seg) <= limit:
+            groups[-1].append(i)
+            used += gap + len(seg)
+        else:
+            groups.append([i])
+            used = len(seg)
+    return groups
+
+
+def transcribe_packed(model, segments: list[np.ndarray], spacer: float = SPACER_SECONDS) -> list[str]:
+    """Transcribe ``segments`` as one window and split the text back per segment."""
+    silence = np.zeros(int(spacer * SAMPLE_RATE), dtype=np.float32)
+    parts = []
+    # Words are assigned to the segment whose spacer-midpoint boundary precedes them
+    boundaries = []
+    offset = 0
+    for i, seg in enumerate(segments):
+        if i:
+            parts.append(silence)
+            boundaries.append((offset + len(silence) / 2) / SAMPLE_RATE)
+            offset += len(silence)
+        parts.append(np.asarray(seg, dtype=np.float32))
+        offset += len(seg)
+    window = np.concatenate(parts)
+
+    result = model.transcribe(
+        window,
+        verbose=False,
+        language=LANGUAGE,
+        word_timestamps=True,
+        condition_on_previous_text=False,
+    )
+    words: list[list[str]] = [[] for _ in segments]
+    for piece in result.get("segments", []):
+        items = piece.get("words") or [
+            {"word": piece["text"], "start": piece["start"], "end": piece["end"]}
+        ]
+        for w in items:
+            mid = (w["start"] + w["end"]) / 2
+            words[bisect.bisect_right(boundaries, mid)].append(w["word"])
+    return ["".join(ws).strip() for ws in words]
+
+
+def transcribe_segments(
+    model,
+    segments: list[np.ndarray],
+    batch_size: int = WHISPER_BATCH_SIZE,
+    pack: bool = PACK_SEGMENTS,
+    progress: Callable[[int], None] | None = None,
+) -> list[str]:
+    """Return one transcript per segment, packing and batching where possible.
+
+    ``progress`` is called with the number of segments transcribed so far.
+    """
+    texts: list[str | None] = [None] * len(segments)
+    report = progress or (lambda done: None)
+    if pack:
+        singles = []
+        done = 0
+        for group in pack_segments(segments):
+            if len(group) == 1:
+                singles.append(group[0])
+                continue
+            try:
+                for i, text in zip(group, transcribe_packed(model, [segments[i] for i in group])):
+                    texts[i] = text
+                done += len(group)
+                report(done)
+            except Exception:
+                logger.exception("⚠️ Packed decoding failed, transcribing segments separately")
+                singles.extend(group)
+        if singles:
+            singles.sort()
+            rest = transcribe_segments(
+                model,
+                [segments[i] for i in singles],
+                batch_size,
+                pack=False,
+                progress=lambda n: report(done + n),
+            )
+            for i, text in zip(singles, rest):
+                texts[i] = text
+        return texts
+
+    if batch_size <= 1:
+        for i, seg in enumerate(segments):
+            texts[i] = transcribe_one(model, seg)
+            report(i + 1)
+        return texts
+
+    from whisper.audio import N_SAMPLES
+
+    short = [i for i, seg in enumerate(segments) if len(seg) <= N_SAMPLES]
+    for start in range(0, len(short), batch_size):
+        idx = short[start : start + batch_size]
+        try:
+            for i, text in zip(idx, transcribe_batch(model, [segments[i] for i in idx])):
+                texts[i] = text
+        except Exception:
+            logger.exception("⚠️ Batched decoding failed, falling back to per-segment")
+        report(sum(t is not None for t in texts))
+
+    retried = 0
+    for i, text in enumerate(texts):
+        if text is None:
+            texts[i] = transcribe_one(model, segments[i])
+            retried += 1
+            report(sum(t is not None for t in texts))
+    if retried:
+        logger.info(f"🔁 Transcribed {retried}/{len(segments)} segment(s) individually")
+    return texts
@@ -0,0 +1,62 @@
+"""Audio decoding helpers shared by the pipeline stages.
+
+Recordings are decoded once to 16 kHz mono float32 and the resulting array
+is handed to VAD, Whisper and the speaker encoder directly.
+"""
+import json
+import subprocess
+import wave
+from pathlib import Path
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def load_audio(path: Path, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode ``path`` with ffmpeg into a mono float32 array in ``[-1, 1]``."""
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-threads", "0",
+        "-i", str(path),
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),
+        "-",
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as exc:
+        raise RuntimeError(f"Failed to decode {path}: {exc.stderr.decode(errors='ignore')}") from exc
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def probe_duration(path: Path) -> float | None:
+    """Return the duration in seconds from container metadata, without decoding."""
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "json",
+        str(path),
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+        return float(json.loads(out)["format"]["duration"])
+    except (subprocess.CalledProcessError, OSError, KeyError, ValueError):
+        return None
+
+
+def to_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+def write_wav(path: Path, samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> None:
+    """Write float samples as a 16-bit mono WAV file."""
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(to_pcm16(samples))
@@ -0,0 +1,232 @@
+"""Incremental detection of new audio files under ``AUDIO``.
+
+``AudioWatcher`` reports files that are new or changed since they were last
+seen.  On Linux it uses inotify (via the optional ``inotify_simple``
+package) so new recordings are picked up within seconds.  Otherwise, or if
+inotify cannot be set up, it polls with ``AudioScanner``, which keeps a
+persisted (path, size, mtime) cache plus directory mtimes in the database
+and only lists directories whose mtime changed.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+from common import setup_logging, get_logger
+
+try:  # pragma: no cover - optional dependency
+    from inotify_simple import INotify, flags as inotify_flags
+except Exception:  # pragma: no cover
+    INotify = None
+
+setup_logging()
+logger = get_logger(__name__)
+
+AUDIO_EXTENSIONS = (".m4a",)
+# Files modified more recently than this may still be syncing
+SETTLE_SECONDS = 10
+# Safety-net rescan interval while inotify is active
+RESCAN_INTERVAL = 3600
+
+
+class AudioScanner:
+    """Walks the audio tree, skipping directories that have not changed."""
+
+    def __init__(self, root: Path, conn, extensions=AUDIO_EXTENSIONS):
+        self.root = str(root)
+        self.conn = conn
+        self.extensions = tuple(e.lower() for e in extensions)
+        self._unsettled: dict[str, tuple[int, float]] = {}
+        self._dirs = {
+            path: (mtime, json.loads(subdirs))
+            for path, mtime, subdirs in conn.execute("SELECT path, mtime, subdirs FROM scan_dirs")
+        }
+        self._files: dict[str, dict[str, tuple[int, float]]] = {}
+        for path, d, size, mtime in conn.execute("SELECT path, dir, size, mtime FROM scan_files"):
+            self._files.setdefault(d, {})[path] = (size, mtime)
+
+    def _is_audio(self, name: str) -> bool:
+        return name.lower().endswith(self.extensions)
+
+    def _settled(self, key: tuple[int, float], now: float) -> bool:
+        return now - key[1] >= SETTLE_SECONDS
+
+    def scan(self) -> list[Path]:
+        """Return audio files that are new or changed since the last scan."""
+        now = time.time()
+        found: list[Path] = []
+        dir_rows, file_rows, removed_files, seen_dirs = [], [], [], set()
+
+        # Files that were still being written last time
+        for path, key in list(self._unsettled.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._unsettled[path]
+                continue
+            current = (st.st_size, st.st_mtime)
+            if current == key and self._settled(current, now):
+                del self._unsettled[path]
+                d = os.path.dirname(path)
+                self._files.setdefault(d, {})[path] = current
+                file_rows.append((path, d, *current))
+                found.append(Path(path))
+            else:
+                self._unsettled[path] = current
+
+        stack = [self.root]
+        while stack:
+            d = stack.pop()
+            seen_dirs.add(d)
+            try:
+                mtime = os.stat(d).st_mtime
+            except OSError:
+                continue
+            cached = self._dirs.get(d)
+            if cached and cached[0] == mtime:
+                stack.extend(cached[1])
+                continue
+
+            subdirs, present, unsettled = [], set(), False
+            known = self._files.setdefault(d, {})
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not self._is_audio(entry.name):
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                present.add(entry.path)
+                key = (st.st_size, st.st_mtime)
+                if known.get(entry.path) == key:
+                    continue
+                if not self._settled(key, now):
+                    self._unsettled[entry.path] = key
+                    unsettled = True
+                    continue
+                self._unsettled.pop(entry.path, None)
+                known[entry.path] = key
+                file_rows.append((entry.path, d, *key))
+                found.append(Path(entry.path))
+            for path in [p for p in known if p not in present]:
+                del known[path]
+                removed_files.append((path,))
+            # Leave the mtime unset while files settle so the dir is listed again
+            self._dirs[d] = (None if unsettled else mtime, subdirs)
+            dir_rows.append((d, self._dirs[d][0], json.dumps(subdirs)))
+            stack.extend(subdirs)
+
+        gone = [d for d in self._dirs if d not in seen_dirs]
+        for d in gone:
+            del self._dirs[d]
+            removed_files.extend((p,) for p in self._files.pop(d, {}))
+
+        with self.conn:
+            self.conn.executemany("REPLACE INTO scan_dirs (path, mtime, subdirs) VALUES (?, ?, ?)", dir_rows)
+            self.conn.executemany("DELETE FROM scan_dirs WHERE path = ?", [(d,) for d in gone])
+            self.conn.executemany("REPLACE INTO scan_files (path, dir, size, mtime) VALUES (?, ?, ?, ?)", file_rows)
+            self.conn.executemany("DELETE FROM scan_files WHERE path = ?", removed_files)
+        return sorted(found)
+
+    def known_paths(self) -> list[str]:
+        """Every settled audio file recorded by the last scan."""
+        return [p for files in self._files.values() for p in files]
+
+    def mark_seen(self, path: Path) -> bool:
+        """Record a file reported by inotify; ``False`` if it was already known."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        d, key = str(path.parent), (st.st_size, st.st_mtime)
+        if self._files.get(d, {}).get(str(path)) == key:
+            return False
+        self._files.setdefault(d, {})[str(path)] = key
+        with self.conn:
+            self.conn.execute(
+                "REPLACE INTO scan_files (path, dir, size, mtime) VALUES (?, ?, ?, ?)",
+                (str(path), d, *key),
+            )
+        return True
+
+
+class AudioWatcher:
+    """Yields new audio files, event-driven where inotify is available."""
+
+    def __init__(self, root: Path, conn, poll_interval: float = 60, use_inotify: bool = True):
+        self.root = Path(root)
+        self.scanner = AudioScanner(self.root, conn)
+        self.poll_interval = poll_interval
+        self._inotify = None
+        self._watches: dict[int, Path] = {}
+        self._last_scan = 0.0
+        if use_inotify and INotify is not None:
+            try:
+                self._inotify = INotify()
+                for dirpath, _, _ in os.walk(self.root):
+                    self._add_watch(Path(dirpath))
+                logger.info(f"👀 Watching {len(self._watches)} directories with inotify")
+            except OSError:
+                logger.exception("⚠️ inotify unavailable, falling back to polling")
+                self.close()
+                self._inotify = None
+
+    @property
+    def event_driven(self) -> bool:
+        return self._inotify is not None
+
+    def _add_watch(self, path: Path) -> None:
+        mask = (
+            inotify_flags.CLOSE_WRITE
+            | inotify_flags.MOVED_TO
+            | inotify_flags.CREATE
+            | inotify_flags.DELETE_SELF
+        )
+        self._watches[self._inotify.add_watch(str(path), mask)] = path
+
+    def scan(self) -> list[Path]:
+        """Full incremental scan against the persisted cache."""
+        self._last_scan = time.monotonic()
+        return self.scanner.scan()
+
+    def wait(self, timeout: float | None = None) -> list[Path]:
+        """Block up to ``timeout`` seconds and return newly seen files."""
+        timeout = self.poll_interval if timeout is None else timeout
+        if self._inotify is None:
+            time.sleep(timeout)
+            return self.scan()
+
+        found: list[Path] = []
+        for event in self._inotify.read(timeout=int(timeout * 1000)):
+            base = self._watches.get(event.wd)
+            if base is None:
+                continue
+            path = base / event.name if event.name else base
+            if event.mask & inotify_flags.DELETE_SELF:
+                self._watches.pop(event.wd, None)
+            elif event.mask & inotify_flags.ISDIR:
+                if event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                    try:
+                        for dirpath, _, _ in os.walk(path):
+                            self._add_watch(Path(dirpath))
+                    except OSError:
+                        logger.exception(f"⚠️ Failed to watch {path}")
+                    # Files may have landed before the watch existed
+                    found.extend(self.scan())
+            elif event.mask & (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO):
+                if self.scanner._is_audio(path.name) and self.scanner.mark_seen(path):
+                    found.append(path)
+        if time.monotonic() - self._last_scan > RESCAN_INTERVAL:
+            found.extend(self.scan())
+        return sorted(set(found))
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
@@ -0,0 +1,151 @@
+"""Token-budget transcript chunking shared by the LLM stages.
+
+Transcripts are grouped into speaker turns (consecutive lines from the same
+speaker) and whole turns are packed into chunks of at most ``CHUNK_TOKENS``
+tokens, optionally repeating the last ``CHUNK_OVERLAP_TOKENS`` worth of
+turns at the start of the next chunk for context.  A turn is only split
+(between lines, never inside one) when it alone exceeds the budget.
+
+Tokens are counted with ``tiktoken`` when it is installed and estimated at
+four characters per token otherwise.  Everything runs in one pass, so
+:func:`chunk_recording` can stream segments straight from the database.
+"""
+import math
+import os
+import re
+from collections import deque
+from typing import Iterable, Iterator
+
+from common import setup_logging, get_logger
+
+try:  # tiktoken is optional; without it token counts are estimated
+    import tiktoken  # type: ignore
+except Exception:  # pragma: no cover
+    tiktoken = None
+
+try:  # python-dotenv may not be installed
+    from dotenv import load_dotenv  # type: ignore
+except Exception:  # pragma: no cover
+    load_dotenv = lambda: None
+
+# Settings below are read at import, possibly before the caller loads .env
+load_dotenv()
+setup_logging()
+logger = get_logger(__name__)
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "2000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+# "[Alex] hello" or "Alex: hello"
+_SPEAKER_RE = re.compile(r"^\s*(?:\[([^\]]*)\]|([^:\[\]]{1,40}):\s)")
+
+_encoder = None
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in ``text`` (estimated without ``tiktoken``)."""
+    global _encoder
+    if tiktoken is not None:
+        if _encoder is None:
+            _encoder = tiktoken.get_encoding(TOKEN_ENCODING)
+        return len(_encoder.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _speaker_of(line: str) -> str | None:
+    match = _SPEAKER_RE.match(line)
+    if not match:
+        return None
+    return match.group(1) if match.group(1) is not None else match.group(2)
+
+
+def iter_turns(lines: Iterable[tuple[str | None, str]]) -> Iterator[tuple[list[str], int]]:
+    """Group ``(speaker, line)`` pairs into turns of ``(lines, tokens)``.
+
+    A ``None`` speaker continues the current turn.
+    """
+    current, tokens, speaker = [], 0, None
+    for line_speaker, line in lines:
+        if current and line_speaker is not None and line_speaker != speaker:
+            yield current, tokens
+            current, tokens = [], 0
+        if line_speaker is not None:
+            speaker = line_speaker
+        current.append(line)
+        # +1 for the newline joining it to the next line
+        tokens += count_tokens(line) + 1
+    if current:
+        yield current, tokens
+
+
+def _split_turn(lines: list[str], budget: int) -> Iterator[tuple[list[str], int]]:
+    part, tokens = [], 0
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if part and tokens + cost > budget:
+            yield part, tokens
+            part, tokens = [], 0
+        part.append(line)
+        tokens += cost
+    if part:
+        yield part, tokens
+
+
+def pack_turns(
+    turns: Iterable[tuple[list[str], int]],
+    budget: int = CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[str]:
+    """Pack whole turns into chunks of at most ``budget`` tokens."""
+    chunk = deque()
+    tokens = 0
+
+    def emit():
+        return "\n".join(line for lines, _ in chunk for line in lines)
+
+    for turn in turns:
+        pieces = _split_turn(turn[0], budget) if turn[1] > budget else [turn]
+        for lines, cost in pieces:
+            if chunk and tokens + cost > budget:
+                yield emit()
+                # Carry trailing turns forward as context, within the overlap
+                carried, carried_tokens = [], 0
+                while chunk and carried_tokens + chunk[-1][1] <= min(overlap, budget - cost):
+                    item = chunk.pop()
+                    carried.append(item)
+                    carried_tokens += item[1]
+                chunk = deque(reversed(carried))
+                tokens = carried_tokens
+            chunk.append((lines, cost))
+            tokens += cost
+    if chunk:
+        yield emit()
+
+
+def chunk_text(text: str, budget: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS) -> list[str]:
+    """Chunk a rendered transcript (one ``[Speaker] text`` line per segment)."""
+    lines = ((_speaker_of(line), line) for line in text.splitlines() if line.strip())
+    return list(pack_turns(iter_turns(lines), budget, overlap))
+
+
+def chunk_recording(
+    conn, recording_id: int, budget: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS
+) -> Iterator[str]:
+    """Chunk a recording's transcript, streaming segments from the database.
+
+    Lines are rendered as ``[label] transcript``; turns follow
+    ``speaker_id`` so unlabelled speakers are still kept apart.
+    """
+    rows = conn.execute(
+        """
+        SELECT s.speaker_id, sp.label, s.transcript
+        FROM segments s
+        LEFT JOIN speakers sp ON sp.id = s.speaker_id
+        WHERE s.recording_id = ?
+        ORDER BY s.start_time ASC
+        """,
+        (recording_id,),
+    )
+    lines = ((speaker_id or "", f"[{label or ''}] {transcript}") for speaker_id, label, transcript in rows)
+    return pack_turns(iter_turns(lines), budget, overlap)
@@ -1,7 +1,8 @@
 import os
-import sqlite3
-from pathlib import Path
 from common import setup_logging, get_logger
+import database
+import migrations
+from reconcile import remove_completed_jobs
 
 try:  # python-dotenv may not be installed
     from dotenv import load_dotenv  # type: ignore
@@ -20,22 +21,9 @@ def cleanup_jobs_queue():
     if not DB_PATH:
         raise RuntimeError("TRANSCRIPTS_DB must be set in the environment")
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id, file_path FROM jobs")
-    jobs = cursor.fetchall()
-    removed = 0
-
-    for job_id, file_path in jobs:
-        filename = Path(file_path).name
-        cursor.execute("SELECT 1 FROM recordings WHERE filename = ?", (filename,))
-        if cursor.fetchone():
-            cursor.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
-            logger.info(f"🗑️ Removed completed job for: {filename}")
-            removed += 1
-
-    conn.commit()
+    conn = database.connect(DB_PATH)
+    migrations.migrate(conn)
+    removed = remove_completed_jobs(conn)
     conn.close()
     logger.info(f"✅ Removed {removed} completed job(s)")
 
@@ -0,0 +1,225 @@
+"""Vectorised k-means clustering of speaker embeddings.
+
+Distances and centroid updates are batched matrix operations, and Lloyd
+iterations stop once inertia stops improving; choosing the speaker count
+for a recording with thousands of segments takes around a second.  The number of
+speakers is chosen automatically by silhouette score over a ``k`` range,
+optionally seeded with the centroids of known global speakers.
+"""
+import os
+
+import numpy as np
+
+from common import setup_logging, get_logger
+
+setup_logging()
+logger = get_logger(__name__)
+
+CLUSTER_SEED = int(os.getenv("CLUSTER_SEED", "0"))
+# Seeded k-means++ restarts for k=2, the lowest-inertia run is kept;
+# cluster_speakers scales it down for larger k
+CLUSTER_N_INIT = int(os.getenv("CLUSTER_N_INIT", "8"))
+# Below this silhouette score a recording is treated as a single speaker
+MIN_SILHOUETTE = float(os.getenv("SPEAKER_MIN_SILHOUETTE", "0.1"))
+# Silhouette is O(n^2); larger recordings are scored on a sample
+SILHOUETTE_SAMPLE = 2000
+# Known speakers closer than this (cosine) to some segment may seed clustering
+SEED_DISTANCE = 0.3
+
+
+def _sq_norms(data: np.ndarray) -> np.ndarray:
+    return np.einsum("ij,ij->i", data, data)
+
+
+def _sq_distances(data: np.ndarray, centroids: np.ndarray, data_sq: np.ndarray | None = None) -> np.ndarray:
+    """Squared euclidean distances between every row of ``data`` and ``centroids``.
+
+    Pass ``data_sq`` (``_sq_norms(data)``) when calling repeatedly on the same data.
+    """
+    if data_sq is None:
+        data_sq = _sq_norms(data)
+    d = (
+        data_sq[:, None]
+        - 2.0 * data @ centroids.T
+        + _sq_norms(centroids)[None, :]
+    )
+    return np.maximum(d, 0.0)
+
+
+def kmeans_plus_plus(
+    data: np.ndarray,
+    k: int,
+    rng: np.random.Generator,
+    init: np.ndarray | None = None,
+    data_sq: np.ndarray | None = None,
+) -> np.ndarray:
+    """Pick ``k`` initial centroids with k-means++, keeping any ``init`` rows first."""
+    n = len(data)
+    if data_sq is None:
+        data_sq = _sq_norms(data)
+    centroids = [] if init is None else [np.asarray(c, dtype=data.dtype) for c in init[:k]]
+    if not centroids:
+        centroids.append(data[rng.integers(n)])
+    closest = _sq_distances(data, np.array(centroids), data_sq).min(axis=1)
+    while len(centroids) < k:
+        total = closest.sum()
+        if total <= 0:
+            idx = rng.integers(n)
+        else:
+            idx = rng.choice(n, p=closest / total)
+        centroids.append(data[idx])
+        closest = np.minimum(closest, _sq_distances(data, data[idx : idx + 1], data_sq)[:, 0])
+    return np.array(centroids)
+
+
+def _lloyd(
+    data: np.ndarray, centroids: np.ndarray, iterations: int, tol: float, data_sq: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, float]:
+    """Refine ``centroids`` with Lloyd iterations; returns ``(labels, centroids, inertia)``.
+
+    Stops when an iteration improves inertia by less than ``tol`` (relative).
+    """
+    n, k = len(data), len(centroids)
+    rows = np.arange(n)
+    previous = np.inf
+    for i in range(iterations + 1):
+        dists = _sq_distances(data, centroids, data_sq)
+        labels = dists.argmin(axis=1)
+        closest = dists[rows, labels]
+        inertia = float(closest.sum())
+        if i == iterations or (i and previous - inertia <= tol * previous):
+            break
+        previous = inertia
+        # Per-cluster sums as one matmul; np.add.at is unbuffered and slow
+        onehot = np.zeros((n, k))
+        onehot[rows, labels] = 1.0
+        counts = onehot.sum(axis=0)
+        sums = onehot.T @ data
+        filled = counts > 0
+        centroids = centroids.copy()
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters with the points furthest from their centroid
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            far = np.argsort(closest)[::-1]
+            centroids[empty] = data[far[: len(empty)]]
+    return labels, centroids, inertia
+
+
+def kmeans(
+    data: np.ndarray,
+    k: int = 2,
+    iterations: int = 50,
+    seed: int = CLUSTER_SEED,
+    init: np.ndarray | None = None,
+    tol: float = 1e-4,
+    n_init: int = CLUSTER_N_INIT,
+) -> tuple[np.ndarray, np.ndarray, float]:
+    """Cluster ``data`` into ``k`` groups, keeping the best of ``n_init`` restarts.
+
+    Returns ``(labels, centroids, inertia)`` of the lowest-inertia run.
+    Runs are deterministic for a given ``seed``.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if len(data) == 0:
+        return np.array([], dtype=int), np.empty((0, data.shape[-1] if data.ndim == 2 else 0)), 0.0
+    k = max(1, min(k, len(data)))
+    # Fully seeded starts are identical, so restarting them gains nothing
+    if init is not None and len(init) >= k:
+        n_init = 1
+    rng = np.random.default_rng(seed)
+    data_sq = _sq_norms(data)
+    best = None
+    for _ in range(max(1, n_init)):
+        run = _lloyd(data, kmeans_plus_plus(data, k, rng, init, data_sq), iterations, tol, data_sq)
+        if best is None or run[2] < best[2]:
+            best = run
+    return best
+
+
+def silhouette_score(data: np.ndarray, labels: np.ndarray, seed: int = CLUSTER_SEED) -> float:
+    """Mean silhouette coefficient of a clustering (euclidean distance)."""
+    data = np.asarray(data, dtype=np.float64)
+    labels = np.asarray(labels)
+    if len(data) > SILHOUETTE_SAMPLE:
+        idx = np.random.default_rng(seed).choice(len(data), SILHOUETTE_SAMPLE, replace=False)
+        data, labels = data[idx], labels[idx]
+    clusters, labels = np.unique(labels, return_inverse=True)
+    if len(clusters) < 2:
+        return 0.0
+
+    dists = np.sqrt(_sq_distances(data, data))
+    onehot = np.eye(len(clusters))[labels]
+    counts = onehot.sum(axis=0)
+    sums = dists @ onehot
+    rows = np.arange(len(data))
+
+    own_counts = counts[labels] - 1
+    a = np.divide(sums[rows, labels], own_counts, out=np.zeros(len(data)), where=own_counts > 0)
+    means = sums / counts[None, :]
+    means[rows, labels] = np.inf
+    b = means.min(axis=1)
+    s = np.divide(b - a, np.maximum(a, b), out=np.zeros(len(data)), where=np.maximum(a, b) > 0)
+    # Points alone in their cluster score zero by convention
+    s[own_counts == 0] = 0.0
+    return float(s.mean())
+
+
+def _seed_centroids(data: np.ndarray, known: np.ndarray | None) -> np.ndarray | None:
+    """Known centroids that are the nearest match for some segments, most popular first."""
+    if known is None or len(known) == 0:
+        return None
+    known = known / (np.linalg.norm(known, axis=1, keepdims=True) + 1e-10)
+    unit = data / (np.linalg.norm(data, axis=1, keepdims=True) + 1e-10)
+    sims = unit @ known.T
+    nearest = sims.argmax(axis=1)
+    close = 1 - sims[np.arange(len(data)), nearest] < SEED_DISTANCE
+    votes = np.bincount(nearest[close], minlength=len(known))
+    order = [i for i in np.argsort(votes)[::-1] if votes[i] > 0]
+    if not order:
+        return None
+    # Seeds live on the data's scale rather than the unit sphere
+    scale = np.linalg.norm(data, axis=1).mean()
+    return known[order] * scale
+
+
+def cluster_speakers(
+    data: np.ndarray,
+    k_min: int = 1,
+    k_max: int = 6,
+    known_centroids: np.ndarray | None = None,
+    seed: int = CLUSTER_SEED,
+    n_init: int = CLUSTER_N_INIT,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Cluster embeddings choosing the speaker count automatically.
+
+    For each ``k`` in ``[max(k_min, 2), k_max]`` the lowest-inertia of
+    ``2 * n_init // k`` k-means runs is scored by silhouette and the best
+    ``k`` wins; when ``k_min`` is 1 and no split scores above
+    ``MIN_SILHOUETTE`` the recording is treated as a single speaker.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    n = len(data)
+    if n == 0:
+        return np.array([], dtype=int), np.empty((0, 0))
+    seeds = _seed_centroids(data, known_centroids)
+
+    best = None
+    for k in range(max(k_min, 2), min(k_max, n - 1) + 1):
+        init = seeds[:k] if seeds is not None else None
+        # Restarts matter most for small k; larger k cost more per run
+        restarts = max(1, 2 * n_init // k)
+        labels, centroids, _ = kmeans(data, k=k, seed=seed, init=init, n_init=restarts)
+        score = silhouette_score(data, labels, seed=seed)
+        logger.debug(f"k={k} silhouette={score:.3f}")
+        if best is None or score > best[0]:
+            best = (score, labels, centroids)
+
+    if best is None or (k_min <= 1 and best[0] < MIN_SILHOUETTE):
+        k = 1 if best is not None else min(max(k_min, 1), n)
+        labels, centroids, _ = kmeans(
+            data, k=k, seed=seed, init=seeds[:k] if seeds is not None else None, n_init=1 if k == 1 else n_init
+        )
+        return labels, centroids
+    logger.info(f"🔢 Selected {len(best[2])} speaker cluster(s) (silhouette {best[0]:.3f})")
+    return best[1], best[2]
@@ -0,0 +1,103 @@
+"""Shared SQLite access for the API and the pipeline scripts.
+
+Every connection is opened in WAL mode with a busy timeout, so readers no
+longer block the writer (and vice versa), and short write bursts from the
+watcher, workers and dashboard wait for each other instead of failing with
+``database is locked``.
+
+``get_connection`` hands out one long-lived connection per thread and
+database path.  Reusing it keeps SQLite's page cache, the memory map and
+the per-connection prepared statement cache warm across requests.  Pooled
+connections must not be closed by callers; use ``connect`` for a private
+connection (e.g. a background heartbeat thread).
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from common import setup_logging, get_logger
+
+setup_logging()
+logger = get_logger(__name__)
+
+DB_PATH = os.getenv("TRANSCRIPTS_DB")
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))
+MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+# Prepared statements kept per connection (sqlite3's default is 128)
+STATEMENT_CACHE_SIZE = 512
+
+_local = threading.local()
+_all_lock = threading.Lock()
+_all: list[sqlite3.Connection] = []
+
+
+def _resolve(db_path) -> str:
+    db_path = db_path or DB_PATH
+    if not db_path:
+        raise RuntimeError("TRANSCRIPTS_DB must be set in the environment")
+    return str(db_path)
+
+
+def configure(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Apply the journal, locking and cache pragmas to ``conn``."""
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # WAL is persistent in the file; this is a no-op after the first connection
+    mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    if mode.lower() != "wal":
+        logger.warning(f"⚠️ SQLite journal mode is {mode}, expected wal")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_MB * 1024}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_MB * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def connect(db_path=None) -> sqlite3.Connection:
+    """Open a new configured connection owned by the caller."""
+    conn = sqlite3.connect(
+        _resolve(db_path),
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    return configure(conn)
+
+
+def get_connection(db_path=None) -> sqlite3.Connection:
+    """Return this thread's pooled connection to ``db_path``.
+
+    A transaction left open by a previous user (e.g. a request that raised)
+    is rolled back before the connection is handed out again.
+    """
+    key = (os.getpid(), str(Path(_resolve(db_path)).resolve()))
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = {}
+    conn = pool.get(key)
+    if conn is not None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            return conn
+        except sqlite3.ProgrammingError:
+            # Closed by someone who should not have
+            pass
+    conn = pool[key] = connect(db_path)
+    with _all_lock:
+        _all.append(conn)
+    return conn
+
+
+def close_connections() -> None:
+    """Close every pooled connection, e.g. on application shutdown."""
+    with _all_lock:
+        conns, _all[:] = list(_all), []
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.__dict__.clear()
@@ -0,0 +1,156 @@
+"""Persistent store of per-segment speaker embeddings.
+
+Embeddings live in the ``segment_embeddings`` table, keyed by segment id and
+validated against the segment file's size/mtime and the encoder version.  A
+segment is embedded once (normally at ingestion) and every later consumer
+reads the stored vector back instead of re-running the encoder.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+
+from common import setup_logging, get_logger
+import model_registry
+
+setup_logging()
+logger = get_logger(__name__)
+
+AUDIO_SEGMENTS_DIR = Path(os.getenv("AUDIO_SEGMENTS", "/mnt/audio/audio_segments"))
+ENCODER_VERSION = os.getenv("EMBEDDING_ENCODER_VERSION", "resemblyzer-256")
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+
+def get_encoder():
+    """Return the process-resident ``VoiceEncoder``."""
+    return model_registry.get("voice_encoder")
+
+
+def resolve_segment_path(path: str | None) -> Path | None:
+    """Map a stored ``embedding_path`` to a file in ``AUDIO_SEGMENTS_DIR``."""
+    if not path:
+        return None
+    segment_path = Path(path)
+    if not segment_path.is_absolute():
+        segment_path = AUDIO_SEGMENTS_DIR / segment_path.name
+    return segment_path
+
+
+def _file_key(path: Path | None) -> tuple[int | None, float | None]:
+    if path is None:
+        return None, None
+    try:
+        st = path.stat()
+    except OSError:
+        return None, None
+    return st.st_size, st.st_mtime
+
+
+def embed_file(path: Path) -> np.ndarray:
+    """Run the speaker encoder over the WAV at ``path``."""
+    from resemblyzer import preprocess_wav
+
+    wav = preprocess_wav(str(path))
+    with model_registry.use("voice_encoder") as encoder:
+        return encoder.embed_utterance(wav)
+
+
+def embed_samples(samples: np.ndarray, sample_rate: int = 16000) -> np.ndarray:
+    """Run the speaker encoder over an in-memory waveform."""
+    from resemblyzer import preprocess_wav
+
+    wav = preprocess_wav(samples, source_sr=sample_rate)
+    with model_registry.use("voice_encoder") as encoder:
+        return encoder.embed_utterance(wav)
+
+
+def store_embedding(cursor, segment_id: int, vector: np.ndarray, path: Path | None = None) -> None:
+    """Persist ``vector`` for ``segment_id``, keyed by the file it came from."""
+    vec = np.asarray(vector, dtype=np.float32)
+    size, mtime = _file_key(path)
+    cursor.execute(
+        """
+        REPLACE INTO segment_embeddings
+            (segment_id, file_size, file_mtime, encoder_version, dim, vector)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (segment_id, size, mtime, ENCODER_VERSION, vec.shape[0], vec.tobytes()),
+    )
+
+
+def get_embeddings(conn, segment_ids, compute_missing: bool = True) -> dict[int, np.ndarray]:
+    """Return ``{segment_id: embedding}`` for ``segment_ids``.
+
+    Stored vectors are used when the encoder version matches and the segment
+    file has not changed since it was embedded.  Missing or stale entries are
+    computed from the segment WAV and written back when ``compute_missing`` is
+    true; segments that cannot be embedded are left out of the result.
+    """
+    cursor = conn.cursor()
+    ids = list(dict.fromkeys(int(i) for i in segment_ids))
+    result: dict[int, np.ndarray] = {}
+    missing: list[tuple[int, Path | None]] = []
+
+    for start in range(0, len(ids), _QUERY_BATCH):
+        batch = ids[start : start + _QUERY_BATCH]
+        placeholders = ",".join("?" * len(batch))
+        rows = cursor.execute(
+            f"""
+            SELECT s.id, s.embedding_path, e.file_size, e.file_mtime,
+                   e.encoder_version, e.vector
+            FROM segments s
+            LEFT JOIN segment_embeddings e ON e.segment_id = s.id
+            WHERE s.id IN ({placeholders})
+            """,
+            batch,
+        ).fetchall()
+        for seg_id, path, size, mtime, version, blob in rows:
+            segment_path = resolve_segment_path(path)
+            if blob is not None and version == ENCODER_VERSION:
+                current_size, current_mtime = _file_key(segment_path)
+                # Files that have gone away keep their last known embedding
+                if current_size is None or (current_size == size and current_mtime == mtime):
+                    result[seg_id] = np.frombuffer(blob, dtype=np.float32)
+                    continue
+            missing.append((seg_id, segment_path))
+
+    if not compute_missing or not missing:
+        return result
+
+    computed = 0
+    for seg_id, segment_path in missing:
+        if segment_path is None or not segment_path.exists():
+            continue
+        try:
+            emb = embed_file(segment_path)
+        except Exception:
+            logger.exception(f"⚠️ Failed to embed {segment_path}")
+            continue
+        store_embedding(cursor, seg_id, emb, segment_path)
+        result[seg_id] = np.asarray(emb, dtype=np.float32)
+        computed += 1
+    if computed:
+        conn.commit()
+        logger.info(f"🧬 Computed {computed} missing segment embedding(s)")
+    return result
+
+
+def get_recording_embeddings(conn, recording_id: int, compute_missing: bool = True) -> dict[int, np.ndarray]:
+    """Return embeddings for every segment of ``recording_id``."""
+    rows = conn.execute(
+        "SELECT id FROM segments WHERE recording_id = ? ORDER BY start_time ASC",
+        (recording_id,),
+    ).fetchall()
+    return get_embeddings(conn, [r[0] for r in rows], compute_missing=compute_missing)
+
+
+def delete_recording_embeddings(cursor, recording_id: int) -> None:
+    cursor.execute(
+        """
+        DELETE FROM segment_embeddings
+        WHERE segment_id IN (SELECT id FROM segments WHERE recording_id = ?)
+        """,
+        (recording_id,),
+    )
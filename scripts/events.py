@@ -0,0 +1,70 @@
+"""Pipeline event channel for live dashboard updates.
+
+Producers in any process (API, worker pool, watcher) append small JSON
+events to the ``events`` table with :func:`publish`, inside the same
+transaction as the change they describe, so an event is visible exactly when
+its data is.  ``GET /api/events`` tails the table by id and forwards new rows
+as server-sent events.  Rows older than ``EVENT_RETENTION_SECONDS`` are
+pruned as new ones are written.
+
+Event types: ``job.created``, ``job.updated``, ``recording.created``,
+``recording.deleted``, ``segments.created``, ``speakers.assigned``,
+``summary.completed``, ``summary.skipped`` (batch recordings that were
+already current or had no segments) and ``summary.failed``.
+"""
+import json
+import os
+import sqlite3
+import time
+
+from common import setup_logging, get_logger
+
+setup_logging()
+logger = get_logger(__name__)
+
+RETENTION_SECONDS = float(os.getenv("EVENT_RETENTION_SECONDS", "3600"))
+# Prune roughly once per this many events
+_PRUNE_EVERY = 500
+
+
+def publish(conn, event_type: str, **payload) -> None:
+    """Record an event in the caller's transaction (the caller commits).
+
+    Failures are logged and swallowed; events must never break the
+    pipeline.
+    """
+    now = time.time()
+    try:
+        cur = conn.execute(
+            "INSERT INTO events (type, payload, created_at) VALUES (?, ?, ?)",
+            (event_type, json.dumps(payload, default=str), now),
+        )
+        if cur.lastrowid % _PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM events WHERE created_at < ?", (now - RETENTION_SECONDS,))
+    except sqlite3.Error:
+        logger.exception(f"⚠️ Failed to publish {event_type} event")
+
+
+def latest_id(conn) -> int:
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+
+def read_since(conn, last_id: int, types: list[str] | None = None, limit: int = 500) -> tuple[list[dict], int]:
+    """Events with ``id > last_id``, oldest first, and the last id read.
+
+    ``types`` matches exact types or prefixes such as ``"job"``; the
+    returned id also covers skipped events so the caller can resume from it.
+    """
+    rows = conn.execute(
+        "SELECT id, type, payload, created_at FROM events WHERE id > ? ORDER BY id LIMIT ?",
+        (last_id, limit),
+    ).fetchall()
+    events = []
+    for event_id, event_type, payload, created_at in rows:
+        last_id = event_id
+        if types and not any(event_type == t or event_type.startswith(t + ".") for t in types):
+            continue
+        events.append(
+            {"id": event_id, "type": event_type, "data": json.loads(payload), "created_at": created_at}
+        )
+    return events, last_id
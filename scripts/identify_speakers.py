@@ -2,8 +2,9 @@ import os
 import re
 import json
 from dotenv import load_dotenv
-from openai import OpenAI
 from common import setup_logging, get_logger
+from chunking import chunk_text
+import llm_client
 from maintain_global_speakers import (
     load_global_map,
     save_global_map,
@@ -14,31 +15,12 @@ from maintain_global_speakers import (
 load_dotenv()
 setup_logging()
 logger = get_logger(__name__)
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TRANSCRIPTS_DIR = os.getenv("TRANSCRIPTS")
 SPEAKER_MAPS_DIR = os.getenv("SPEAKER_MAPS")
 LABELLED_TRANSCRIPTS_DIR = os.getenv("TRANSCRIPTS_LABELLED")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
 # === Helpers ===
 
-def split_into_chunks(text, max_chars=6000):
-    lines = text.splitlines()
-    chunks = []
-    current = ""
-
-    for line in lines:
-        if len(current) + len(line) + 1 > max_chars:
-            chunks.append(current.strip())
-            current = ""
-        current += line + "\n"
-
-    if current.strip():
-        chunks.append(current.strip())
-
-    return chunks
-
 def get_known_speakers(global_map, max_names=5):
     """Return a list of most recently seen speaker names."""
     entries = sorted(
@@ -48,8 +30,8 @@ def get_known_speakers(global_map, max_names=5):
     )
     return [name for name, _ in entries[:max_names]]
 
-def identify_speakers_from_text(text, global_map, max_chunks=3, chunk_size=6000):
-    chunks = split_into_chunks(text, max_chars=chunk_size)
+def identify_speakers_from_text(text, global_map, max_chunks=3, chunk_tokens=1500):
+    chunks = chunk_text(text, budget=chunk_tokens)
     chunks = chunks[:max_chunks]
 
     known_speakers = get_known_speakers(global_map)
@@ -68,15 +50,14 @@ def identify_speakers_from_text(text, global_map, max_chunks=3, chunk_size=6000)
 
     for i, chunk in enumerate(chunks):
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
+            reply = llm_client.complete(
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": chunk}
                 ],
                 temperature=0.3
             )
-            result = json.loads(response.choices[0].message.content)
+            result = json.loads(reply)
 
             for speaker, name in result.items():
                 if speaker not in aggregated_map:
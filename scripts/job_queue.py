@@ -0,0 +1,305 @@
+"""Lease-based claiming of rows in the ``jobs`` table.
+
+A worker claims a job atomically and holds it under a lease that it renews
+with heartbeats while it works.  Jobs whose lease expires (the worker
+crashed) become claimable again.  Failures are retried with exponential
+backoff and after ``JOB_MAX_ATTEMPTS`` the job is moved to the ``dead``
+state so poison files stop being re-processed.
+
+Job states: ``pending`` -> ``processing`` -> ``completed``, or back to
+``pending`` (with ``next_attempt_at`` in the future) on failure, or
+``dead`` once attempts are exhausted.
+
+While a job runs, the pipeline reports its ``stage`` and segment progress
+through the callable yielded by :func:`lease`; :func:`describe_progress`
+turns those columns into elapsed time and an ETA.
+"""
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from common import setup_logging, get_logger
+import database
+import events
+
+setup_logging()
+logger = get_logger(__name__)
+
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "60"))
+RETRY_MAX_SECONDS = 6 * 3600
+PROGRESS_INTERVAL = 1.0  # seconds
+
+_PROGRESS_COLUMNS = (
+    "status", "attempts", "last_error", "stage", "stage_started_at",
+    "progress_done", "progress_total", "started_at", "finished_at",
+)
+
+# A job is claimable when it is due, or when its worker stopped heartbeating
+_CLAIMABLE = """
+    (status = 'pending' AND next_attempt_at <= :now)
+    OR (status = 'processing' AND COALESCE(lease_expires_at, 0) < :now)
+"""
+
+
+class JobLeasedError(RuntimeError):
+    """Raised when a job is currently held by another worker."""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim(conn, worker_id: str, job_id: int | None = None, lease_seconds: float = LEASE_SECONDS):
+    """Claim a job and return ``(id, file_path, attempts)``, or ``None``.
+
+    Without ``job_id`` the next due job is taken.  With ``job_id`` only that
+    job is considered, and only if it is due or its lease has expired; if
+    another worker holds a live lease :class:`JobLeasedError` is raised.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if job_id is None:
+            row = conn.execute(
+                f"""
+                SELECT id, file_path FROM jobs
+                WHERE {_CLAIMABLE}
+                ORDER BY next_attempt_at, created_at, id
+                LIMIT 1
+                """,
+                {"now": now},
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT id, file_path, status, lease_expires_at, next_attempt_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is not None:
+                _, _, status, lease_expires_at, next_attempt_at = row
+                leased = status == "processing" and (lease_expires_at or 0) >= now
+                if leased:
+                    raise JobLeasedError(f"Job {job_id} is being processed by another worker")
+                due = status == "pending" and (next_attempt_at or 0) <= now
+                if not (due or status == "processing"):
+                    row = None
+                else:
+                    row = row[:2]
+        if row is None:
+            conn.rollback()
+            return None
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'processing', worker_id = ?, lease_expires_at = ?,
+                heartbeat_at = ?, attempts = attempts + 1, updated_at = ?,
+                stage = 'starting', stage_started_at = ?, progress_done = NULL,
+                progress_total = NULL, started_at = ?, finished_at = NULL
+            WHERE id = ?
+            """,
+            (worker_id, now + lease_seconds, now, now, now, now, row[0]),
+        )
+        attempts = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (row[0],)).fetchone()[0]
+        _publish_update(conn, row[0])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row[0], row[1], attempts
+
+
+def heartbeat(conn, job_id: int, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+    """Extend the lease; returns ``False`` if the job is no longer ours."""
+    now = time.time()
+    cur = conn.execute(
+        """
+        UPDATE jobs SET lease_expires_at = ?, heartbeat_at = ?, updated_at = ?
+        WHERE id = ? AND worker_id = ? AND status = 'processing'
+        """,
+        (now + lease_seconds, now, now, job_id, worker_id),
+    )
+    conn.commit()
+    return cur.rowcount == 1
+
+
+def complete(conn, job_id: int, worker_id: str) -> None:
+    conn.execute(
+        """
+        UPDATE jobs
+        SET status = 'completed', lease_expires_at = NULL, last_error = NULL, updated_at = ?,
+            stage = 'done', finished_at = ?
+        WHERE id = ? AND worker_id = ?
+        """,
+        (time.time(), time.time(), job_id, worker_id),
+    )
+    _publish_update(conn, job_id)
+    conn.commit()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with jitter for the given number of attempts made."""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def fail(conn, job_id: int, worker_id: str, error: str) -> str:
+    """Record a failure and schedule a retry or dead-letter the job.
+
+    Returns the job's new status.
+    """
+    now = time.time()
+    row = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    attempts = row[0] if row else MAX_ATTEMPTS
+    if attempts >= MAX_ATTEMPTS:
+        status, next_attempt = "dead", 0
+    else:
+        status, next_attempt = "pending", now + backoff_seconds(attempts)
+    conn.execute(
+        """
+        UPDATE jobs
+        SET status = ?, next_attempt_at = ?, last_error = ?, lease_expires_at = NULL, updated_at = ?,
+            finished_at = ?
+        WHERE id = ? AND worker_id = ?
+        """,
+        (status, next_attempt, error[:2000], now, now, job_id, worker_id),
+    )
+    _publish_update(conn, job_id)
+    conn.commit()
+    return status
+
+
+def requeue(conn, job_id: int) -> bool:
+    """Make ``job_id`` due immediately; ``False`` if it does not exist.
+
+    Raises :class:`JobLeasedError` if a worker currently holds it.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT status, lease_expires_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+        if row[0] == "processing" and (row[1] or 0) >= now:
+            conn.rollback()
+            raise JobLeasedError(f"Job {job_id} is being processed by another worker")
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'pending', next_attempt_at = 0, stage = 'queued', stage_started_at = ?,
+                progress_done = NULL, progress_total = NULL, finished_at = NULL, updated_at = ?
+            WHERE id = ?
+            """,
+            (now, now, job_id),
+        )
+        _publish_update(conn, job_id)
+        conn.commit()
+    except JobLeasedError:
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def set_progress(conn, job_id: int, stage: str, done: int | None = None, total: int | None = None) -> None:
+    now = time.time()
+    conn.execute(
+        """
+        UPDATE jobs
+        SET stage_started_at = CASE WHEN stage IS ? THEN stage_started_at ELSE ? END,
+            stage = ?, progress_done = ?, progress_total = ?, updated_at = ?
+        WHERE id = ?
+        """,
+        (stage, now, stage, done, total, now, job_id),
+    )
+    _publish_update(conn, job_id)
+    conn.commit()
+
+
+def describe_progress(row: dict, now: float | None = None) -> dict:
+    """Elapsed seconds and, while a counted stage runs, an ETA for a job row."""
+    now = time.time() if now is None else now
+    started, finished = row.get("started_at"), row.get("finished_at")
+    elapsed = ((finished or now) - started) if started else None
+    eta = None
+    done, total = row.get("progress_done"), row.get("progress_total")
+    if row.get("status") == "processing" and done and total and row.get("stage_started_at"):
+        # Assume the rest of the stage runs at the rate seen so far
+        eta = (now - row["stage_started_at"]) / done * max(0, total - done)
+    return {
+        "stage": row.get("stage"),
+        "done": done,
+        "total": total,
+        "elapsed": round(elapsed, 1) if elapsed is not None else None,
+        "eta": round(eta, 1) if eta is not None else None,
+    }
+
+
+def _publish_update(conn, job_id: int) -> None:
+    row = conn.execute(
+        f"SELECT {', '.join(_PROGRESS_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    if row is not None:
+        job = dict(zip(_PROGRESS_COLUMNS, row))
+        events.publish(
+            conn,
+            "job.updated",
+            id=job_id,
+            status=job["status"],
+            attempts=job["attempts"],
+            last_error=job["last_error"],
+            **describe_progress(job),
+        )
+
+
+@contextmanager
+def lease(db_path, job_id: int, worker_id: str, lease_seconds: float = LEASE_SECONDS):
+    """Keep the lease on ``job_id`` alive from a background thread.
+
+    Yields ``report(stage, done=None, total=None)`` for progress updates.
+    Updates within a stage are written at most every
+    ``PROGRESS_INTERVAL`` seconds.
+    """
+    stop = threading.Event()
+
+    def _beat():
+        conn = database.connect(db_path)
+        try:
+            while not stop.wait(lease_seconds / 3):
+                try:
+                    if not heartbeat(conn, job_id, worker_id, lease_seconds):
+                        logger.warning(f"⚠️ Lost lease on job {job_id}")
+                        return
+                except sqlite3.Error:
+                    logger.exception(f"⚠️ Heartbeat failed for job {job_id}")
+        finally:
+            conn.close()
+
+    progress_conn = database.connect(db_path)
+    last = {"stage": None, "at": 0.0}
+
+    def report(stage: str, done: int | None = None, total: int | None = None) -> None:
+        now = time.monotonic()
+        final = done is not None and done == total
+        if stage == last["stage"] and not final and now - last["at"] < PROGRESS_INTERVAL:
+            return
+        last.update(stage=stage, at=now)
+        try:
+            set_progress(progress_conn, job_id, stage, done, total)
+        except sqlite3.Error:
+            logger.exception(f"⚠️ Failed to record progress for job {job_id}")
+
+    thread = threading.Thread(target=_beat, daemon=True)
+    thread.start()
+    try:
+        yield report
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+        progress_conn.close()
@@ -1,8 +1,10 @@
 import os
-import time
-import sqlite3
 from pathlib import Path
 from common import setup_logging, get_logger
+import database
+import migrations
+from reconcile import reconcile
+from audio_watcher import AudioWatcher
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,58 +15,39 @@ AUDIO_DIR = os.getenv("AUDIO")
 DB_PATH = os.getenv("TRANSCRIPTS_DB")
 POLL_INTERVAL = 60  # seconds
 
+def _log_result(result):
+    for path in result["new"]:
+        logger.info(f"📥 Queued job for: {path}")
+    if result["stale"]:
+        logger.info(f"🗑️ Removed {result['stale']} job(s) for missing files")
+
 def scan_for_new_files():
-    """Recursively scan the audio directory and queue new files."""
+    """Watch the audio directory and queue new files."""
     if not AUDIO_DIR or not DB_PATH:
         raise RuntimeError("AUDIO and TRANSCRIPTS_DB must be set in the environment")
 
     root_dir = Path(AUDIO_DIR)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    conn = database.connect(DB_PATH)
     logger.debug(DB_PATH)
 
-    # Ensure the jobs table exists so lookups/inserts don't fail
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS jobs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_path TEXT UNIQUE NOT NULL,
-            status TEXT DEFAULT 'pending',
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-        """
-    )
-    conn.commit()
-
-    def iter_audio_files():
-        for dirpath, _, filenames in os.walk(root_dir):
-            for name in filenames:
-                if name.lower().endswith(".m4a"):
-                    yield Path(dirpath) / name
+    # Bring the schema (jobs lease columns, scan cache, indexes) up to date
+    migrations.migrate(conn)
 
-    logger.info(f"📡 Monitoring '{root_dir}' for new audio files...")
+    watcher = AudioWatcher(root_dir, conn, poll_interval=POLL_INTERVAL)
+    mode = "inotify" if watcher.event_driven else f"polling every {POLL_INTERVAL} seconds"
+    logger.info(f"📡 Monitoring '{root_dir}' for new audio files ({mode})...")
     try:
+        # Full pass on startup: queue anything missed while stopped and drop
+        # jobs for recordings that were deleted from disk
+        watcher.scan()
+        result = reconcile(conn, watcher.scanner.known_paths(), complete=True)
+        _log_result(result)
         while True:
-            for path in iter_audio_files():
-                # Skip files already transcribed
-                cursor.execute("SELECT 1 FROM recordings WHERE filename = ?", (path.name,))
-                if cursor.fetchone():
-                    continue
-
-                # Skip files already queued as jobs
-                cursor.execute("SELECT 1 FROM jobs WHERE file_path = ?", (str(path),))
-                if cursor.fetchone():
-                    continue
-
-                cursor.execute(
-                    "INSERT INTO jobs (file_path, status) VALUES (?, 'pending')",
-                    (str(path),),
-                )
-                conn.commit()
-                logger.info(f"📥 Queued job for: {path}")
-
-            time.sleep(POLL_INTERVAL)
+            new_files = watcher.wait()
+            if new_files:
+                _log_result(reconcile(conn, new_files))
     finally:
+        watcher.close()
         conn.close()
 
 if __name__ == "__main__":
@@ -1,13 +1,20 @@
 import sys
 import os
-import sqlite3
+import re
+import json
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
 from dotenv import load_dotenv
-from openai import OpenAI
 
 from common import setup_logging, get_logger
+import database
+import llm_client
+import migrations
+from chunking import count_tokens
 from maintain_global_speakers import load_global_map, save_global_map, update_global_map
 
 # === Setup ===
@@ -16,8 +23,14 @@ setup_logging()
 logger = get_logger(__name__)
 
 DB_PATH = Path(os.getenv("TRANSCRIPTS_DB", Path(__file__).resolve().parent.parent / "transcripts.db"))
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+
+# Utterances sampled per speaker, and the token budget for each speaker's sample
+SAMPLE_UTTERANCES = int(os.getenv("LABEL_SAMPLE_UTTERANCES", "12"))
+SAMPLE_TOKENS = int(os.getenv("LABEL_SAMPLE_TOKENS", "600"))
+# Longer utterances are cut to this many characters
+MAX_UTTERANCE_CHARS = 400
+# Bump whenever a prompt below changes so cached labels are regenerated
+PROMPT_VERSION = "1"
 
 SYSTEM_PROMPT = (
     "Given a collection of utterances from a single speaker, "
@@ -25,9 +38,15 @@ SYSTEM_PROMPT = (
     "Return a short label."
 )
 
+BATCH_SYSTEM_PROMPT = (
+    "You are given sample utterances from each speaker in one recording. "
+    "For every speaker, infer the most likely name or role (e.g., Jozef, Alex, Manager). "
+    "Respond ONLY with a JSON object mapping each speaker id to a short label."
+)
+
 def fetch_segments(recording_id: int) -> dict[str, list[str]]:
     """Retrieve segments grouped by speaker_id for a recording."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.get_connection(DB_PATH)
     cursor = conn.cursor()
     rows = cursor.execute(
         """
@@ -38,7 +57,6 @@ def fetch_segments(recording_id: int) -> dict[str, list[str]]:
         """,
         (recording_id,),
     ).fetchall()
-    conn.close()
 
     grouped: dict[str, list[str]] = {}
     for speaker_id, transcript in rows:
@@ -47,25 +65,120 @@ def fetch_segments(recording_id: int) -> dict[str, list[str]]:
         grouped.setdefault(speaker_id, []).append(transcript)
     return grouped
 
+def sample_utterances(
+    parts: list[str], count: int = SAMPLE_UTTERANCES, budget: int = SAMPLE_TOKENS
+) -> list[str]:
+    """Pick a bounded, representative sample of one speaker's utterances.
+
+    The utterances (in time order) are split into ``count`` equal stretches
+    and the longest of each is kept, so the sample spans the whole recording
+    and favours the most informative lines.  The result stays in time order
+    and within ``budget`` tokens.
+    """
+    if len(parts) > count:
+        step = len(parts) / count
+        picked = []
+        for i in range(count):
+            stretch = range(int(i * step), int((i + 1) * step))
+            picked.append(max(stretch, key=lambda j: len(parts[j])))
+    else:
+        picked = range(len(parts))
+
+    sample, tokens = [], 0
+    for j in picked:
+        text = parts[j][:MAX_UTTERANCE_CHARS]
+        cost = count_tokens(text)
+        if sample and tokens + cost > budget:
+            break
+        sample.append(text)
+        tokens += cost
+    return sample
+
+def sample_hash(sample: list[str]) -> str:
+    payload = "\n".join([PROMPT_VERSION, llm_client.DEFAULT_MODEL, *sample])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_cached_labels(recording_id: int, hashes: dict[str, str]) -> dict[str, str]:
+    """Labels already inferred from the same samples of this recording."""
+    conn = database.get_connection(DB_PATH)
+    rows = conn.execute(
+        "SELECT speaker_id, sample_hash, label FROM speaker_label_cache WHERE recording_id = ?",
+        (recording_id,),
+    ).fetchall()
+    return {sid: label for sid, digest, label in rows if hashes.get(sid) == digest}
+
+def store_cached_labels(recording_id: int, labels: dict[str, str], hashes: dict[str, str]):
+    conn = database.get_connection(DB_PATH)
+    now = time.time()
+    conn.executemany(
+        "REPLACE INTO speaker_label_cache (recording_id, speaker_id, sample_hash, label, created_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(recording_id, sid, hashes[sid], label, now) for sid, label in labels.items()],
+    )
+    conn.commit()
+
+def _parse_labels(reply: str, speaker_ids) -> dict[str, str]:
+    # Models sometimes wrap JSON in a code fence
+    match = re.search(r"\{.*\}", reply, re.DOTALL)
+    try:
+        data = json.loads(match.group(0)) if match else {}
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        sid: str(data[sid]).strip()
+        for sid in speaker_ids
+        if isinstance(data.get(sid), str) and data[sid].strip()
+    }
+
+def infer_labels(samples: dict[str, list[str]]) -> dict[str, str]:
+    """Label every speaker in one structured call.
+
+    Speakers the reply does not cover are labelled with concurrent
+    single-speaker calls.
+    """
+    prompt = "\n\n".join(
+        f"### {sid}\n" + "\n".join(f"- {line}" for line in sample) for sid, sample in samples.items()
+    )
+    labels = {}
+    try:
+        reply = llm_client.complete(
+            [
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.3,
+        )
+        labels = _parse_labels(reply, samples)
+    except Exception:
+        logger.exception("⚠️ GPT error labelling speakers")
+
+    missing = [sid for sid in samples if sid not in labels]
+    if missing:
+        logger.info(f"Labelling {len(missing)} speaker(s) individually")
+        with ThreadPoolExecutor(max_workers=max(1, llm_client.CONCURRENCY)) as pool:
+            results = pool.map(infer_label, ["\n".join(samples[sid]) for sid in missing])
+            labels.update((sid, label) for sid, label in zip(missing, results) if label)
+    return labels
+
 def infer_label(text: str) -> str | None:
-    """Call OpenAI to infer a human-friendly label."""
+    """Ask the LLM for a human-friendly label."""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
+        return llm_client.complete(
+            [
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": text},
             ],
             temperature=0.3,
         )
-        return response.choices[0].message.content.strip()
     except Exception:
         logger.exception("⚠️ GPT error")
         return None
 
 def update_speaker_labels(recording_id: int, labels: dict[str, str]):
     """Persist speaker labels to DB and global_speakers.json."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.get_connection(DB_PATH)
     cursor = conn.cursor()
     for speaker_id, label in labels.items():
         cursor.execute(
@@ -74,7 +187,6 @@ def update_speaker_labels(recording_id: int, labels: dict[str, str]):
             (speaker_id, label),
         )
     conn.commit()
-    conn.close()
 
     global_map = load_global_map()
     timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S")
@@ -89,14 +201,23 @@ def main(recording_id: int):
         logger.error(f"No segments found for recording {recording_id}")
         return
 
-    labels: dict[str, str] = {}
-    for speaker_id, parts in segments.items():
-        text = "\n".join(parts)
-        logger.info(f"Labelling {speaker_id} with {len(parts)} utterances")
-        label = infer_label(text)
-        if label:
-            labels[speaker_id] = label
-            logger.info(f"→ {speaker_id} identified as {label}")
+    samples = {sid: sample_utterances(parts) for sid, parts in segments.items()}
+    hashes = {sid: sample_hash(sample) for sid, sample in samples.items()}
+    labels = load_cached_labels(recording_id, hashes)
+    todo = {sid: sample for sid, sample in samples.items() if sid not in labels}
+    logger.info(
+        f"Labelling {len(todo)} speaker(s) from {sum(len(s) for s in todo.values())} sampled utterances "
+        f"({len(labels)} cached)"
+    )
+    if todo:
+        fresh = infer_labels(todo)
+        if fresh:
+            store_cached_labels(recording_id, fresh, hashes)
+        labels.update(fresh)
+
+    for speaker_id in samples:
+        if speaker_id in labels:
+            logger.info(f"→ {speaker_id} identified as {labels[speaker_id]}")
         else:
             logger.warning(f"Failed to label {speaker_id}")
 
@@ -114,4 +235,5 @@ if __name__ == "__main__":
     except ValueError:
         logger.error("Recording ID must be an integer")
         sys.exit(1)
+    migrations.migrate(database.get_connection(DB_PATH))
     main(rec_id)
@@ -0,0 +1,304 @@
+"""Shared client for every LLM call in the pipeline.
+
+All stages go through :func:`complete` (or :func:`acomplete` from async
+code), which applies, process-wide:
+
+* a concurrency limit (``LLM_CONCURRENCY`` calls in flight);
+* request and token rate limits (``LLM_REQUESTS_PER_MINUTE``,
+  ``LLM_TOKENS_PER_MINUTE``; 0 disables either);
+* retries with jittered exponential backoff on rate limits, timeouts and
+  server errors;
+* an on-disk response cache keyed by a hash of the full request
+  (``LLM_CACHE_DIR``; empty disables it);
+* latency and token metrics, see :func:`metrics`.
+
+Backends are pluggable: ``openai`` (the default; point ``LLM_BASE_URL`` at
+any OpenAI-compatible server, e.g. a local stand-in) and ``echo``, an
+in-process fake for tests and benchmarks.  Register others with
+:func:`register_backend` and select them with ``LLM_BACKEND``.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from common import setup_logging, get_logger
+from chunking import count_tokens
+
+try:  # python-dotenv may not be installed
+    from dotenv import load_dotenv  # type: ignore
+except Exception:  # pragma: no cover
+    load_dotenv = lambda: None
+
+# Settings below are read at import, possibly before the caller loads .env
+load_dotenv()
+setup_logging()
+logger = get_logger(__name__)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "gpt-4")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "60"))
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", str(Path(__file__).resolve().parent.parent / "llm_cache"))
+# Simulated latency of the echo backend
+ECHO_LATENCY_MS = float(os.getenv("LLM_ECHO_LATENCY_MS", "0"))
+
+# A backend takes (model, messages, temperature) and returns
+# (text, prompt_tokens, completion_tokens)
+Backend = Callable[[str, list[dict], float], tuple[str, int, int]]
+
+
+class RateLimiter:
+    """Token bucket refilled at ``per_minute``; holds at most a minute's worth.
+
+    ``acquire`` blocks until ``amount`` is available.  ``charge`` takes an
+    amount known only afterwards (e.g. completion tokens) without blocking;
+    the debt delays later callers.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self._available = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) / self.rate
+            time.sleep(wait)
+
+    def charge(self, amount: float) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._available -= amount
+
+
+_slots = threading.BoundedSemaphore(max(1, CONCURRENCY))
+_request_limiter = RateLimiter(REQUESTS_PER_MINUTE)
+_token_limiter = RateLimiter(TOKENS_PER_MINUTE)
+
+_backend_factories: dict[str, Callable[[], Backend]] = {}
+_backends: dict[str, Backend] = {}
+_backend_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "calls": 0,
+    "cache_hits": 0,
+    "retries": 0,
+    "errors": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "latency_seconds": 0.0,
+}
+
+
+def register_backend(name: str, factory: Callable[[], Backend]) -> None:
+    """Register ``factory`` as the constructor for backend ``name``."""
+    with _backend_lock:
+        _backend_factories[name] = factory
+        _backends.pop(name, None)
+
+
+def get_backend(name: str | None = None) -> Backend:
+    """Return backend ``name`` (default ``LLM_BACKEND``), creating it once."""
+    name = name or LLM_BACKEND
+    with _backend_lock:
+        if name not in _backends:
+            if name not in _backend_factories:
+                raise KeyError(f"Unknown LLM backend: {name}")
+            _backends[name] = _backend_factories[name]()
+        return _backends[name]
+
+
+def _openai_backend() -> Backend:
+    from openai import OpenAI
+
+    # Retries are handled here so they share the rate limits
+    client = OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=LLM_BASE_URL,
+        timeout=TIMEOUT_SECONDS,
+        max_retries=0,
+    )
+
+    def call(model, messages, temperature):
+        response = client.chat.completions.create(model=model, messages=messages, temperature=temperature)
+        usage = response.usage
+        return (
+            response.choices[0].message.content.strip(),
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+        )
+
+    return call
+
+
+def _echo_backend() -> Backend:
+    def call(model, messages, temperature):
+        if ECHO_LATENCY_MS:
+            time.sleep(ECHO_LATENCY_MS / 1000)
+        text = messages[-1]["content"][:200]
+        return text, sum(count_tokens(m["content"]) for m in messages), count_tokens(text)
+
+    return call
+
+
+register_backend("openai", _openai_backend)
+register_backend("echo", _echo_backend)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    name = type(exc).__name__
+    return isinstance(exc, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+def _backoff(attempt: int) -> float:
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2**attempt)
+    return delay * random.uniform(0.5, 1.5)
+
+
+def request_key(backend: str, model: str, messages: list[dict], temperature: float) -> str:
+    payload = json.dumps(
+        {"backend": backend, "model": model, "messages": messages, "temperature": temperature},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return Path(CACHE_DIR) / key[:2] / f"{key}.json"
+
+
+def _cache_get(key: str) -> str | None:
+    try:
+        with open(_cache_path(key), "r", encoding="utf-8") as f:
+            return json.load(f)["text"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _cache_put(key: str, text: str, prompt_tokens: int, completion_tokens: int) -> None:
+    path = _cache_path(key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "text": text,
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "created_at": time.time(),
+                },
+                f,
+            )
+        os.replace(tmp, path)
+    except OSError:
+        logger.exception("⚠️ Could not write LLM cache entry")
+
+
+def _record(**values) -> None:
+    with _metrics_lock:
+        for name, value in values.items():
+            _metrics[name] += value
+
+
+def complete(
+    messages: list[dict],
+    model: str | None = None,
+    temperature: float = 0.5,
+    cache: bool = True,
+    backend: str | None = None,
+) -> str:
+    """Run one chat completion and return the reply text."""
+    backend_name = backend or LLM_BACKEND
+    model = model or DEFAULT_MODEL
+    key = request_key(backend_name, model, messages, temperature) if cache and CACHE_DIR else None
+    if key:
+        cached = _cache_get(key)
+        if cached is not None:
+            _record(calls=1, cache_hits=1)
+            return cached
+
+    call = get_backend(backend_name)
+    estimate = sum(count_tokens(m["content"]) for m in messages)
+    attempt = 0
+    while True:
+        with _slots:
+            _request_limiter.acquire()
+            _token_limiter.acquire(estimate)
+            started = time.monotonic()
+            try:
+                text, prompt_tokens, completion_tokens = call(model, messages, temperature)
+                error = None
+            except Exception as e:
+                error = e
+            latency = time.monotonic() - started
+        if error is None:
+            break
+        if attempt >= MAX_RETRIES or not _is_retryable(error):
+            _record(calls=1, errors=1, latency_seconds=latency)
+            raise error
+        delay = _backoff(attempt)
+        attempt += 1
+        _record(retries=1)
+        logger.warning(f"🔁 LLM call failed ({type(error).__name__}), retry {attempt} in {delay:.1f}s")
+        time.sleep(delay)
+
+    # The estimate was charged up front; settle the difference
+    _token_limiter.charge(prompt_tokens + completion_tokens - estimate)
+    _record(
+        calls=1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        latency_seconds=latency,
+    )
+    logger.debug(f"🤖 {model}: {latency:.2f}s, {prompt_tokens}+{completion_tokens} tokens")
+    if key:
+        _cache_put(key, text, prompt_tokens, completion_tokens)
+    return text
+
+
+async def acomplete(messages: list[dict], **kwargs) -> str:
+    """Async :func:`complete`; shares the same process-wide limits."""
+    return await asyncio.to_thread(complete, messages, **kwargs)
+
+
+def metrics() -> dict:
+    """Aggregate call metrics since the process started."""
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    uncached = snapshot["calls"] - snapshot["cache_hits"]
+    snapshot["avg_latency_seconds"] = snapshot["latency_seconds"] / uncached if uncached else None
+    return snapshot
@@ -0,0 +1,420 @@
+"""Versioned schema migrations for the transcripts database.
+
+Each migration runs once, in its own transaction, and is recorded in
+``schema_version``.  Migrations are written to be idempotent (``IF NOT
+EXISTS`` and column checks) because databases created before this module
+already contain some of these tables.  ``migrate`` is called by the API at
+startup, by ``init_db.py`` and by every long-running service, so existing
+databases are upgraded in place.
+
+Migration 12 (transcript search) is a no-op on SQLite builds without
+FTS5; ``migrate`` builds the index on a later start once FTS5 is
+available.
+
+To change the schema, append a new ``(version, description, statements)``
+entry to ``MIGRATIONS``; never edit one that has shipped.
+"""
+import time
+
+from common import setup_logging, get_logger
+
+setup_logging()
+logger = get_logger(__name__)
+
+
+def _add_columns(table: str, columns: dict[str, str]):
+    def apply(conn) -> None:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+    return apply
+
+
+# External-content index over segments.transcript; the triggers keep it in
+# step with every insert, delete and transcript edit
+_SEGMENT_SEARCH = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+        transcript, content='segments', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_segments_fts_insert AFTER INSERT ON segments
+    BEGIN
+        INSERT INTO segments_fts (rowid, transcript) VALUES (NEW.id, NEW.transcript);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_segments_fts_delete AFTER DELETE ON segments
+    BEGIN
+        INSERT INTO segments_fts (segments_fts, rowid, transcript) VALUES ('delete', OLD.id, OLD.transcript);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_segments_fts_update AFTER UPDATE OF transcript ON segments
+    BEGIN
+        INSERT INTO segments_fts (segments_fts, rowid, transcript) VALUES ('delete', OLD.id, OLD.transcript);
+        INSERT INTO segments_fts (rowid, transcript) VALUES (NEW.id, NEW.transcript);
+    END
+    """,
+    "INSERT INTO segments_fts (segments_fts) VALUES ('rebuild')",
+]
+
+
+def _has_fts5(conn) -> bool:
+    return "ENABLE_FTS5" in {row[0] for row in conn.execute("PRAGMA compile_options")}
+
+
+def _has_segment_search(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'segments_fts'").fetchone() is not None
+
+
+def _create_segment_search(conn) -> None:
+    if not _has_fts5(conn):
+        logger.warning("⚠️ SQLite was built without FTS5; transcript search is unavailable")
+        return
+    for statement in _SEGMENT_SEARCH:
+        conn.execute(statement)
+
+
+def _ensure_segment_search(conn) -> None:
+    """Build the search index migration 12 skipped, once FTS5 is available."""
+    if _has_segment_search(conn) or not _has_fts5(conn):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not _has_segment_search(conn):
+            _create_segment_search(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info("🧱 Built the transcript search index")
+
+
+MIGRATIONS = [
+    (
+        1,
+        "core tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS recordings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT NOT NULL,
+                datetime TEXT,
+                duration_sec REAL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recording_id INTEGER NOT NULL,
+                start_time REAL,
+                end_time REAL,
+                speaker_id TEXT,
+                transcript TEXT,
+                embedding_path TEXT,
+                FOREIGN KEY (recording_id) REFERENCES recordings(id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS speakers (
+                id TEXT PRIMARY KEY,
+                label TEXT,
+                profile_path TEXT,
+                last_seen TEXT
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_path TEXT UNIQUE NOT NULL,
+                status TEXT DEFAULT 'pending',
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "summaries and speaker samples",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                recording_id INTEGER PRIMARY KEY,
+                summary TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS speaker_samples (
+                speaker_id TEXT,
+                segment_id INTEGER,
+                FOREIGN KEY (speaker_id) REFERENCES speakers(id),
+                FOREIGN KEY (segment_id) REFERENCES segments(id)
+            )
+            """,
+        ],
+    ),
+    (
+        3,
+        "stored segment embeddings",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS segment_embeddings (
+                segment_id INTEGER PRIMARY KEY,
+                file_size INTEGER,
+                file_mtime REAL,
+                encoder_version TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                FOREIGN KEY (segment_id) REFERENCES segments(id)
+            )
+            """,
+        ],
+    ),
+    (
+        4,
+        "job leases and retries",
+        [
+            _add_columns(
+                "jobs",
+                {
+                    "worker_id": "TEXT",
+                    "lease_expires_at": "REAL",
+                    "heartbeat_at": "REAL",
+                    "attempts": "INTEGER NOT NULL DEFAULT 0",
+                    "next_attempt_at": "REAL NOT NULL DEFAULT 0",
+                    "last_error": "TEXT",
+                    "updated_at": "REAL",
+                },
+            ),
+        ],
+    ),
+    (
+        5,
+        "audio scan cache",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS scan_dirs (
+                path TEXT PRIMARY KEY,
+                mtime REAL,
+                subdirs TEXT NOT NULL DEFAULT '[]'
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS scan_files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        6,
+        "hot-path indexes",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_segments_recording ON segments(recording_id, start_time)",
+            "CREATE INDEX IF NOT EXISTS idx_segments_speaker ON segments(speaker_id)",
+            "CREATE INDEX IF NOT EXISTS idx_recordings_filename ON recordings(filename)",
+            "CREATE INDEX IF NOT EXISTS idx_recordings_datetime ON recordings(datetime)",
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status_due ON jobs(status, next_attempt_at)",
+            # Duplicates predate the unique index
+            """
+            DELETE FROM speaker_samples
+            WHERE rowid NOT IN (
+                SELECT MIN(rowid) FROM speaker_samples GROUP BY speaker_id, segment_id
+            )
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_speaker_samples_unique ON speaker_samples(speaker_id, segment_id)",
+            "CREATE INDEX IF NOT EXISTS idx_speaker_samples_segment ON speaker_samples(segment_id)",
+        ],
+    ),
+    (
+        7,
+        "recording aggregates and keyset index",
+        [
+            _add_columns(
+                "recordings",
+                {
+                    "segment_count": "INTEGER NOT NULL DEFAULT 0",
+                    "has_summary": "INTEGER NOT NULL DEFAULT 0",
+                },
+            ),
+            """
+            UPDATE recordings SET
+                segment_count = (SELECT COUNT(*) FROM segments s WHERE s.recording_id = recordings.id),
+                has_summary = EXISTS (SELECT 1 FROM summaries su WHERE su.recording_id = recordings.id)
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_segments_count_insert AFTER INSERT ON segments
+            BEGIN
+                UPDATE recordings SET segment_count = segment_count + 1 WHERE id = NEW.recording_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_segments_count_delete AFTER DELETE ON segments
+            BEGIN
+                UPDATE recordings SET segment_count = segment_count - 1 WHERE id = OLD.recording_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_segments_count_move AFTER UPDATE OF recording_id ON segments
+            WHEN OLD.recording_id IS NOT NEW.recording_id
+            BEGIN
+                UPDATE recordings SET segment_count = segment_count - 1 WHERE id = OLD.recording_id;
+                UPDATE recordings SET segment_count = segment_count + 1 WHERE id = NEW.recording_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_summaries_flag_insert AFTER INSERT ON summaries
+            BEGIN
+                UPDATE recordings SET has_summary = 1 WHERE id = NEW.recording_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_summaries_flag_delete AFTER DELETE ON summaries
+            BEGIN
+                UPDATE recordings SET has_summary = 0 WHERE id = OLD.recording_id;
+            END
+            """,
+            # Keyset pagination walks (datetime, id); the speaker filter
+            # reads recording ids straight from the index
+            "DROP INDEX IF EXISTS idx_recordings_datetime",
+            "CREATE INDEX IF NOT EXISTS idx_recordings_datetime_id ON recordings(datetime, id)",
+            "DROP INDEX IF EXISTS idx_segments_speaker",
+            "CREATE INDEX IF NOT EXISTS idx_segments_speaker_recording ON segments(speaker_id, recording_id)",
+        ],
+    ),
+    (
+        8,
+        "job progress",
+        [
+            _add_columns(
+                "jobs",
+                {
+                    "stage": "TEXT",
+                    "stage_started_at": "REAL",
+                    "progress_done": "INTEGER",
+                    "progress_total": "INTEGER",
+                    "started_at": "REAL",
+                    "finished_at": "REAL",
+                },
+            ),
+        ],
+    ),
+    (
+        9,
+        "event channel",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at)",
+        ],
+    ),
+    (
+        10,
+        "summary cache",
+        [
+            _add_columns(
+                "summaries",
+                {
+                    "content_hash": "TEXT",
+                    "model": "TEXT",
+                    "prompt_version": "TEXT",
+                    "updated_at": "REAL",
+                },
+            ),
+            """
+            CREATE TABLE IF NOT EXISTS summary_chunks (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                model TEXT,
+                prompt_version TEXT,
+                created_at REAL
+            )
+            """,
+        ],
+    ),
+    (
+        11,
+        "speaker label cache",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS speaker_label_cache (
+                recording_id INTEGER NOT NULL,
+                speaker_id TEXT NOT NULL,
+                sample_hash TEXT NOT NULL,
+                label TEXT NOT NULL,
+                created_at REAL,
+                PRIMARY KEY (recording_id, speaker_id)
+            )
+            """,
+        ],
+    ),
+    (
+        12,
+        "transcript full-text search",
+        [_create_segment_search],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at REAL
+        )
+        """
+    )
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn) -> int:
+    """Apply pending migrations and return the schema version."""
+    conn.commit()
+    version = current_version(conn)
+    conn.commit()
+    if version >= LATEST_VERSION:
+        _ensure_segment_search(conn)
+        return version
+
+    for number, description, steps in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if current_version(conn) >= number:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (number, description, time.time()),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"🧱 Applied migration {number}: {description}")
+    _ensure_segment_search(conn)
+    return LATEST_VERSION
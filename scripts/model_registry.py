@@ -0,0 +1,154 @@
+"""Process-wide registry of lazily loaded models.
+
+Models are loaded on first use and stay resident for the life of the
+process, so jobs and API requests stop paying the load cost repeatedly.
+Models are not safe to share between threads (Whisper installs kv-cache
+hooks while decoding), so callers run them inside :func:`use`, which lets
+one thread at a time use each model.
+Services can warm models up at start, and when ``MODEL_MEMORY_BUDGET_MB`` is
+set the least recently used models are unloaded to stay within it.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from common import setup_logging, get_logger
+
+setup_logging()
+logger = get_logger(__name__)
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+# 0 disables eviction
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# Comma-separated model names loaded by ``warm_up()`` when none are given
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "")
+
+_loaders: dict[str, Callable[[], Any]] = {}
+_models: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+_lock = threading.Lock()
+_load_locks: dict[str, threading.Lock] = {}
+_use_locks: dict[str, threading.Lock] = {}
+
+
+def register(name: str, loader: Callable[[], Any]) -> None:
+    """Register ``loader`` as the factory for model ``name``."""
+    with _lock:
+        _loaders[name] = loader
+        _load_locks.setdefault(name, threading.Lock())
+        _use_locks.setdefault(name, threading.Lock())
+
+
+def _estimate_mb(model: Any) -> float:
+    """Approximate resident size of a torch model (or tuple containing one)."""
+    if isinstance(model, tuple):
+        return sum(_estimate_mb(m) for m in model)
+    total = 0
+    for attr in ("parameters", "buffers"):
+        fn = getattr(model, attr, None)
+        if not callable(fn):
+            continue
+        try:
+            total += sum(t.numel() * t.element_size() for t in fn())
+        except Exception:
+            pass
+    return total / (1024 * 1024)
+
+
+def _evict(keep: str) -> None:
+    if MODEL_MEMORY_BUDGET_MB <= 0:
+        return
+    used = sum(size for _, size in _models.values())
+    for name in list(_models):
+        if used <= MODEL_MEMORY_BUDGET_MB:
+            break
+        if name == keep:
+            continue
+        _, size = _models.pop(name)
+        used -= size
+        logger.info(f"♻️ Unloaded model '{name}' ({size:.0f} MB) to stay within budget")
+
+
+def get(name: str) -> Any:
+    """Return model ``name``, loading it on first use."""
+    with _lock:
+        if name in _models:
+            _models.move_to_end(name)
+            return _models[name][0]
+        if name not in _loaders:
+            raise KeyError(f"Unknown model: {name}")
+        load_lock = _load_locks[name]
+
+    # Load outside the registry lock so other models stay available meanwhile
+    with load_lock:
+        with _lock:
+            if name in _models:
+                _models.move_to_end(name)
+                return _models[name][0]
+        started = time.monotonic()
+        model = _loaders[name]()
+        size = _estimate_mb(model)
+        logger.info(f"📦 Loaded model '{name}' in {time.monotonic() - started:.1f}s ({size:.0f} MB)")
+        with _lock:
+            _models[name] = (model, size)
+            _evict(keep=name)
+        return model
+
+
+@contextmanager
+def use(name: str):
+    """Yield model ``name`` while holding its lock, loading it on first use."""
+    with _lock:
+        if name not in _use_locks:
+            raise KeyError(f"Unknown model: {name}")
+        use_lock = _use_locks[name]
+    with use_lock:
+        yield get(name)
+
+
+def unload(name: str) -> None:
+    with _lock:
+        _models.pop(name, None)
+
+
+def loaded() -> list[str]:
+    """Names of the currently resident models, least recently used first."""
+    with _lock:
+        return list(_models)
+
+
+def warm_up(names: list[str] | None = None) -> None:
+    """Load ``names`` (default: ``MODEL_WARMUP``) so the first job does not wait."""
+    if names is None:
+        names = [n.strip() for n in MODEL_WARMUP.split(",") if n.strip()]
+    for name in names:
+        try:
+            get(name)
+        except Exception:
+            logger.exception(f"⚠️ Failed to warm up model '{name}'")
+
+
+def _load_whisper():
+    import whisper
+
+    return whisper.load_model(WHISPER_MODEL)
+
+
+def _load_voice_encoder():
+    from resemblyzer import VoiceEncoder
+
+    return VoiceEncoder()
+
+
+def _load_silero_vad():
+    import torch
+
+    model, utils = torch.hub.load("snakers4/silero-vad", "silero_vad", trust_repo=True)
+    return model, utils
+
+
+register("whisper", _load_whisper)
+register("voice_encoder", _load_voice_encoder)
+register("silero_vad", _load_silero_vad)
@@ -1,73 +1,104 @@
 import os
-import time
-import subprocess
 from pathlib import Path
 
 import requests
 from dotenv import load_dotenv
 
 from common import setup_logging, get_logger
-from transcribe_and_split import transcribe_and_split
+from audio_watcher import AudioWatcher
+from transcribe_and_split import is_ingested, transcribe_and_split
+import database
+import job_queue
+import migrations
+from reconcile import reconcile
+import model_registry
+import speaker_identification
 
 load_dotenv()
 setup_logging()
 logger = get_logger(__name__)
 
 AUDIO_DIR = os.getenv("AUDIO")
+DB_PATH = os.getenv("TRANSCRIPTS_DB")
+WORKER_ID = job_queue.default_worker_id()
 
 POLL_INTERVAL = 60  # seconds
 
-def get_all_audio_files():
-    files = []
-    for root, _, filenames in os.walk(AUDIO_DIR):
-        for filename in filenames:
-            if filename.lower().endswith(".m4a"):
-                full_path = os.path.join(root, filename)
-                files.append(full_path)
-    return files
+def _queue_files(conn, paths, complete=False):
+    """Add newly seen files to the job queue."""
+    if not paths:
+        return
+    new = reconcile(conn, paths, complete=complete)["new"]
+    if new:
+        logger.info(f"📥 Queued {len(new)} new file(s)")
 
-def process_file(audio_path):
-    """Transcribe, identify speakers, and summarise a single audio file."""
-    try:
-        logger.info(f"🔁 Transcribing and splitting: {audio_path}")
-        recording_id = transcribe_and_split(Path(audio_path).resolve())
-        if recording_id is None:
-            logger.info("⏭️  File already processed or failed during transcription.")
-            return False
+def _run_stages(audio_path, progress=None):
+    """Transcribe, identify speakers, and summarise a single audio file.
 
-        logger.info(f"🧠 Identifying speakers for recording {recording_id}...")
-        subprocess.run(
-            ["python", "speaker_identification.py", str(recording_id)], check=True
-        )
+    Returns ``True`` if a new recording was created, ``False`` if the file
+    had already been processed.  Transcription failures raise.
+    """
+    report = progress or (lambda stage, done=None, total=None: None)
+    logger.info(f"🔁 Transcribing and splitting: {audio_path}")
+    recording_id = transcribe_and_split(Path(audio_path).resolve(), progress=report)
+    if recording_id is None:
+        if not is_ingested(database.get_connection(DB_PATH), Path(audio_path).resolve()):
+            raise RuntimeError("Transcription failed")
+        logger.info("⏭️  File already processed.")
+        return False
 
-        logger.info(f"📝 Requesting summarisation for recording {recording_id}...")
+    logger.info(f"🧠 Identifying speakers for recording {recording_id}...")
+    report("speakers")
+    speaker_identification.main(recording_id)
+
+    logger.info(f"📝 Requesting summarisation for recording {recording_id}...")
+    report("summarising")
+    try:
         resp = requests.post(
             f"http://127.0.0.1:8000/api/recordings/{recording_id}/summarize"
         )
         resp.raise_for_status()
-        logger.info("✅ All stages completed.\n")
-        return True
-    except subprocess.CalledProcessError:
-        logger.exception("❌ Error during speaker identification")
     except requests.RequestException:
         logger.exception("❌ Error during summarisation request")
-    except Exception:
+    logger.info("✅ All stages completed.\n")
+    return True
+
+def process_next_job(conn):
+    """Claim and process the next due job; ``False`` when nothing is due."""
+    job = job_queue.claim(conn, WORKER_ID)
+    if job is None:
+        return False
+    job_id, audio_path, attempts = job
+    try:
+        with job_queue.lease(DB_PATH, job_id, WORKER_ID) as report:
+            _run_stages(audio_path, report)
+    except Exception as exc:
         logger.exception("❌ Unexpected error during processing")
-    return False
+        status = job_queue.fail(conn, job_id, WORKER_ID, str(exc) or type(exc).__name__)
+        logger.info(f"⏳ Job {job_id} failed on attempt {attempts}, now {status}")
+        return True
+    job_queue.complete(conn, job_id, WORKER_ID)
+    return True
 
 def monitor_loop():
-    logger.info(f"📡 Polling '{AUDIO_DIR}' every {POLL_INTERVAL} seconds...")
+    model_registry.warm_up(["whisper", "silero_vad", "voice_encoder"])
+    conn = database.connect(DB_PATH)
+    migrations.migrate(conn)
+    watcher = AudioWatcher(Path(AUDIO_DIR), conn, poll_interval=POLL_INTERVAL)
+    mode = "inotify" if watcher.event_driven else f"polling every {POLL_INTERVAL} seconds"
+    logger.info(f"📡 Monitoring '{AUDIO_DIR}' ({mode})...")
+    # Full pass on startup: files the persisted scan cache already knew
+    # about are not "new" to scan(), but may still lack a job
+    watcher.scan()
+    _queue_files(conn, watcher.scanner.known_paths(), complete=True)
     while True:
         processed_any = False
-        audio_files = get_all_audio_files()
-        for audio_path in audio_files:
-            if process_file(audio_path):
-                processed_any = True
-                break  # Stop after one new file to avoid overlap
+        while process_next_job(conn):
+            processed_any = True
 
         if not processed_any:
             logger.info("📭 No new files detected.")
-        time.sleep(POLL_INTERVAL)
+        _queue_files(conn, watcher.wait())
 
 if __name__ == "__main__":
     monitor_loop()
@@ -0,0 +1,127 @@
+"""Set-based reconciliation of audio files against ``recordings`` and ``jobs``.
+
+Instead of two lookups and a commit per file, the file list is loaded into a
+temporary table and compared with ``recordings.filename`` and
+``jobs.file_path`` in a handful of indexed joins, and every change is
+applied in one transaction.
+
+- *new* files have neither a recording nor a job and get queued
+- *completed* jobs already have a recording and are removed
+- *stale* jobs point at files that are no longer on disk (only checked when
+  the caller passes the complete file list)
+"""
+from pathlib import Path
+
+from common import setup_logging, get_logger
+import events
+
+setup_logging()
+logger = get_logger(__name__)
+
+
+def _load_files(conn, paths) -> None:
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS scanned_files (file_path TEXT PRIMARY KEY, filename TEXT NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS temp.idx_scanned_files_filename ON scanned_files(filename)")
+    conn.execute("DELETE FROM temp.scanned_files")
+    conn.executemany(
+        "INSERT OR IGNORE INTO temp.scanned_files (file_path, filename) VALUES (?, ?)",
+        ((str(p), Path(p).name) for p in paths),
+    )
+
+
+def _load_jobs(conn) -> None:
+    # Job rows store full paths while recordings store bare filenames
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS job_files (id INTEGER PRIMARY KEY, filename TEXT NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS temp.idx_job_files_filename ON job_files(filename)")
+    conn.execute("DELETE FROM temp.job_files")
+    conn.executemany(
+        "INSERT INTO temp.job_files (id, filename) VALUES (?, ?)",
+        ((job_id, Path(file_path).name) for job_id, file_path in conn.execute("SELECT id, file_path FROM jobs").fetchall()),
+    )
+
+
+def _queue_new(conn) -> list[str]:
+    new = [
+        row[0]
+        for row in conn.execute(
+            """
+            SELECT s.file_path FROM temp.scanned_files s
+            WHERE NOT EXISTS (SELECT 1 FROM recordings r WHERE r.filename = s.filename)
+              AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.file_path = s.file_path)
+            ORDER BY s.file_path
+            """
+        )
+    ]
+    conn.executemany("INSERT INTO jobs (file_path, status) VALUES (?, 'pending')", ((p,) for p in new))
+    if new:
+        events.publish(conn, "job.created", count=len(new))
+    return new
+
+
+def _remove_completed(conn) -> int:
+    # Jobs under a live lease are left for their worker to finish
+    return conn.execute(
+        """
+        DELETE FROM jobs
+        WHERE status != 'processing'
+          AND id IN (
+              SELECT jf.id FROM temp.job_files jf
+              JOIN recordings r ON r.filename = jf.filename
+          )
+        """
+    ).rowcount
+
+
+def _remove_stale(conn) -> int:
+    return conn.execute(
+        """
+        DELETE FROM jobs
+        WHERE status != 'processing'
+          AND file_path NOT IN (SELECT file_path FROM temp.scanned_files)
+        """
+    ).rowcount
+
+
+def reconcile(conn, paths, complete: bool = False, prune_completed: bool = False) -> dict:
+    """Queue new files from ``paths`` and prune the job table in one transaction.
+
+    ``complete`` declares ``paths`` to be every audio file on disk, which
+    allows jobs for missing files to be removed.  ``prune_completed`` also
+    deletes jobs whose recording already exists.  Returns the queued paths
+    and the number of jobs removed.
+    """
+    result = {"new": [], "completed": 0, "stale": 0}
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _load_files(conn, paths)
+        result["new"] = _queue_new(conn)
+        if prune_completed:
+            _load_jobs(conn)
+            result["completed"] = _remove_completed(conn)
+        # An empty listing more likely means the share is not mounted
+        if complete and conn.execute("SELECT 1 FROM temp.scanned_files LIMIT 1").fetchone():
+            result["stale"] = _remove_stale(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def remove_completed_jobs(conn) -> int:
+    """Delete every job whose recording is already in the database."""
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _load_jobs(conn)
+        removed = _remove_completed(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return removed
@@ -1,12 +1,16 @@
-import sqlite3
 import sys
 from pathlib import Path
 
 import os
 from common import setup_logging, get_logger
+import database
+import embedding_store
+import events
+import migrations
+import clustering
+import speaker_index
 
 import numpy as np
-from resemblyzer import VoiceEncoder, preprocess_wav
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,183 +20,140 @@ logger = get_logger(__name__)
 
 DB_PATH = Path(os.getenv("TRANSCRIPTS_DB", Path(__file__).resolve().parent.parent / "transcripts.db"))
 AUDIO_SEGMENTS_DIR = Path(os.getenv("AUDIO_SEGMENTS", "/mnt/audio/audio_segments"))
+MIN_SPEAKERS = int(os.getenv("SPEAKER_MIN_COUNT", "1"))
+MAX_SPEAKERS = int(os.getenv("SPEAKER_MAX_COUNT", "6"))
+# Cosine distance above which a cluster becomes a new speaker
+MATCH_THRESHOLD = float(os.getenv("SPEAKER_MATCH_THRESHOLD", "0.2"))
 
 
-def _kmeans(data: np.ndarray, k: int = 2, iterations: int = 20):
-    if len(data) == 0:
-        return [], []
-    k = min(k, len(data))
-    centroids = data[np.random.choice(len(data), k, replace=False)]
-    for _ in range(iterations):
-        groups = {i: [] for i in range(k)}
-        for vec in data:
-            idx = np.argmin([np.linalg.norm(vec - c) for c in centroids])
-            groups[idx].append(vec)
-        new_centroids = []
-        for i in range(k):
-            if groups[i]:
-                new_centroids.append(np.mean(groups[i], axis=0))
-            else:
-                new_centroids.append(centroids[i])
-        new_centroids = np.array(new_centroids)
-        if np.allclose(new_centroids, centroids):
-            break
-        centroids = new_centroids
-    labels = [np.argmin([np.linalg.norm(vec - c) for c in centroids]) for vec in data]
-    return labels, centroids
-
-
-def _cosine_distance(a: np.ndarray, b: np.ndarray) -> float:
-    return 1 - float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
+def _next_speaker_index(conn) -> int:
+    """First unused ``speaker_N`` number; call with the write lock held."""
+    next_index = 0
+    for (sid,) in conn.execute("SELECT id FROM speakers WHERE id GLOB 'speaker_*'"):
+        try:
+            next_index = max(next_index, int(sid.split("_")[1]) + 1)
+        except ValueError:
+            pass
+    return next_index
 
 
 def main(recording_id: int):
-    conn = sqlite3.connect(DB_PATH)
+    conn = database.get_connection(DB_PATH)
     cursor = conn.cursor()
     rows = cursor.execute(
-        "SELECT id, embedding_path FROM segments WHERE recording_id = ?",
+        "SELECT id, embedding_path FROM segments WHERE recording_id = ? ORDER BY start_time ASC",
         (recording_id,),
     ).fetchall()
-    conn.close()
 
     if not rows:
         return
 
-    encoder = VoiceEncoder()
+    stored = embedding_store.get_embeddings(conn, [seg_id for seg_id, _ in rows])
     seg_info = []  # (id, path, embedding)
     embeddings = []
     for seg_id, path in rows:
-        try:
-            segment_path = Path(path)
-            if not segment_path.is_absolute():
-                segment_path = AUDIO_SEGMENTS_DIR / segment_path.name
-            wav = preprocess_wav(str(segment_path))
-            emb = encoder.embed_utterance(wav)
-            seg_info.append((seg_id, str(segment_path), emb))
-            embeddings.append(emb)
-        except Exception:
-            logger.exception(f"⚠️ Failed to process {segment_path}")
+        emb = stored.get(seg_id)
+        if emb is None:
+            logger.warning(f"⚠️ No embedding available for segment {seg_id}")
+            continue
+        seg_info.append((seg_id, path, emb))
+        embeddings.append(emb)
     embeddings = np.array(embeddings)
     if len(embeddings) == 0:
         return
 
-    labels, centroids = _kmeans(embeddings, k=2)
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS speaker_samples (
-            speaker_id TEXT,
-            segment_id INTEGER,
-            FOREIGN KEY (speaker_id) REFERENCES speakers(id),
-            FOREIGN KEY (segment_id) REFERENCES segments(id)
-        )
-        """
+    index = speaker_index.load_index(conn)
+    labels, centroids = clustering.cluster_speakers(
+        embeddings,
+        k_min=MIN_SPEAKERS,
+        k_max=MAX_SPEAKERS,
+        known_centroids=index.matrix if len(index) else None,
     )
 
-    # Load existing speaker averages
-    existing = {}
-    next_index = 0
-    speaker_rows = cursor.execute("SELECT id FROM speakers").fetchall()
-    for (sid,) in speaker_rows:
-        if sid.startswith("speaker_"):
-            try:
-                idx = int(sid.split("_")[1])
-                next_index = max(next_index, idx + 1)
-            except ValueError:
-                pass
-        sample_ids = cursor.execute(
-            "SELECT segment_id FROM speaker_samples WHERE speaker_id = ?",
-            (sid,),
-        ).fetchall()
-        embs = []
-        for (seg_id,) in sample_ids:
-            row = cursor.execute(
-                "SELECT embedding_path FROM segments WHERE id=?", (seg_id,)
-            ).fetchone()
-            if not row:
-                continue
-            try:
-                wav = preprocess_wav(row[0])
-                embs.append(encoder.embed_utterance(wav))
-            except Exception:
-                continue
-        if embs:
-            existing[sid] = np.mean(embs, axis=0)
-
+    clusters = []
     for label_idx in range(len(centroids)):
-        cluster = [
-            (seg_info[i][0], seg_info[i][1], embeddings[i])
-            for i in range(len(embeddings))
-            if labels[i] == label_idx
-        ]
-        if not cluster:
+        members = np.flatnonzero(labels == label_idx)
+        if len(members) == 0:
             continue
         centroid = centroids[label_idx]
-        cluster.sort(key=lambda x: np.linalg.norm(x[2] - centroid))
-        top = cluster[:10]
-        rep = np.mean([vec for _, _, vec in top], axis=0)
-
-        best_name = None
-        best_dist = float("inf")
-        for sid, avg in existing.items():
-            dist = _cosine_distance(avg, rep)
-            if dist < best_dist:
-                best_dist = dist
-                best_name = sid
-
-        if best_name is None or best_dist > 0.2:
-            speaker_name = f"speaker_{next_index}"
-            next_index += 1
-            cursor.execute(
-                "INSERT OR IGNORE INTO speakers (id, label) VALUES (?, ?)",
-                (speaker_name, ""),
+        members = members[np.argsort(np.linalg.norm(embeddings[members] - centroid, axis=1))]
+        top = members[:10]
+        clusters.append((members, top, embeddings[top].mean(axis=0)))
+    if not clusters:
+        return
+
+    # Match every cluster representative against known speakers at once
+    match_ids, match_dists = index.query(np.array([rep for _, _, rep in clusters]), k=1)
+
+    # New speaker ids are allocated under the write lock, so concurrent runs
+    # (worker pool, API jobs, /identify) cannot hand out the same speaker_N
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        next_index = _next_speaker_index(conn)
+        assigned = []
+        for c, (members, top, rep) in enumerate(clusters):
+            best_name = match_ids[c, 0] if match_ids.shape[1] else None
+            best_dist = float(match_dists[c, 0]) if match_ids.shape[1] else float("inf")
+            logger.info(
+                f"🔎 Cluster {c} ({len(members)} segments): nearest {best_name} at distance {best_dist:.3f}"
+            )
+
+            if best_name is None or best_dist > MATCH_THRESHOLD:
+                speaker_name = f"speaker_{next_index}"
+                next_index += 1
+                cursor.execute(
+                    "INSERT INTO speakers (id, label) VALUES (?, ?)",
+                    (speaker_name, ""),
+                )
+            else:
+                speaker_name = best_name
+
+            cursor.executemany(
+                "UPDATE segments SET speaker_id=? WHERE id=?",
+                [(speaker_name, seg_info[i][0]) for i in members],
             )
-        else:
-            speaker_name = best_name
-
-        cursor.executemany(
-            "UPDATE segments SET speaker_id=? WHERE id=?",
-            [(speaker_name, seg_id) for seg_id, _, _ in cluster],
-        )
-
-        # Manage speaker sample references
-        existing_samples = []
-        rows = cursor.execute(
-            "SELECT segment_id FROM speaker_samples WHERE speaker_id = ?",
-            (speaker_name,),
-        ).fetchall()
-        for (seg_id,) in rows:
-            row = cursor.execute(
-                "SELECT embedding_path FROM segments WHERE id=?", (seg_id,)
-            ).fetchone()
-            if not row:
-                continue
-            try:
-                wav = preprocess_wav(row[0])
-                existing_samples.append((seg_id, encoder.embed_utterance(wav)))
-            except Exception:
-                continue
-
-        all_samples = existing_samples + [(seg_id, emb) for seg_id, _, emb in top]
-        all_samples.sort(key=lambda x: np.linalg.norm(x[1] - rep))
-        selected = all_samples[:10]
-
-        cursor.execute(
-            "DELETE FROM speaker_samples WHERE speaker_id = ?", (speaker_name,)
-        )
-        cursor.executemany(
-            "INSERT INTO speaker_samples (speaker_id, segment_id) VALUES (?, ?)",
-            [(speaker_name, seg_id) for seg_id, _ in selected],
-        )
 
+            # Manage speaker sample references
+            sample_ids = [
+                seg_id
+                for (seg_id,) in cursor.execute(
+                    "SELECT segment_id FROM speaker_samples WHERE speaker_id = ?",
+                    (speaker_name,),
+                ).fetchall()
+            ]
+            # Already stored by load_index's sync; don't embed audio under the lock
+            sample_embeddings = embedding_store.get_embeddings(conn, sample_ids, compute_missing=False)
+            existing_samples = [
+                (seg_id, sample_embeddings[seg_id]) for seg_id in sample_ids if seg_id in sample_embeddings
+            ]
+
+            all_samples = existing_samples + [(seg_info[i][0], embeddings[i]) for i in top]
+            all_samples.sort(key=lambda x: np.linalg.norm(x[1] - rep))
+            selected = list({seg_id: emb for seg_id, emb in all_samples}.items())[:10]
+
+            cursor.execute(
+                "DELETE FROM speaker_samples WHERE speaker_id = ?", (speaker_name,)
+            )
+            cursor.executemany(
+                "INSERT INTO speaker_samples (speaker_id, segment_id) VALUES (?, ?)",
+                [(speaker_name, seg_id) for seg_id, _ in selected],
+            )
+            assigned.append(speaker_name)
+
+        events.publish(conn, "speakers.assigned", recording_id=recording_id, speakers=assigned)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if index.sync(conn):
+        index.save()
     conn.commit()
-    conn.close()
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         logger.error("Usage: speaker_identification.py RECORDING_ID")
         sys.exit(1)
+    migrations.migrate(database.get_connection(DB_PATH))
     main(int(sys.argv[1]))
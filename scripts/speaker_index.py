@@ -0,0 +1,224 @@
+"""In-memory index of global speaker centroids.
+
+Each known speaker is represented by the normalised mean of its
+``speaker_samples`` embeddings.  The index holds them as a float32 matrix
+alongside an id array so that "nearest known speakers for these N vectors"
+is a single matrix multiply plus top-k.  It is persisted next to the
+database and kept current incrementally: every speaker carries a signature
+of its sample set and only speakers whose samples changed are recomputed.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from common import setup_logging, get_logger
+import embedding_store
+
+setup_logging()
+logger = get_logger(__name__)
+
+DB_PATH = Path(os.getenv("TRANSCRIPTS_DB", Path(__file__).resolve().parent.parent / "transcripts.db"))
+INDEX_PATH = Path(os.getenv("SPEAKER_INDEX_PATH", DB_PATH.with_name(DB_PATH.stem + ".speakers.npz")))
+
+# The index is shared by API request threads and job executor threads;
+# re-entrant because sync() calls upsert()/remove()
+_lock = threading.RLock()
+# Signature prefix of centroids built without some samples' embeddings
+_PARTIAL = "partial:"
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-10)
+
+
+def sample_signatures(conn) -> dict[str, tuple[str, list[int]]]:
+    """Return ``{speaker_id: (signature, sample_segment_ids)}`` from the database."""
+    samples: dict[str, list[int]] = {}
+    for sid, seg_id in conn.execute(
+        "SELECT speaker_id, segment_id FROM speaker_samples ORDER BY speaker_id, segment_id"
+    ).fetchall():
+        samples.setdefault(sid, []).append(seg_id)
+    return {
+        sid: (hashlib.sha1(",".join(map(str, ids)).encode()).hexdigest()[:16], ids)
+        for sid, ids in samples.items()
+    }
+
+
+class SpeakerIndex:
+    """Normalised speaker centroid matrix with matching id and signature arrays."""
+
+    def __init__(self, ids=None, matrix=None, signatures=None, path: Path | None = None):
+        self.ids = list(ids or [])
+        self.signatures = list(signatures or [""] * len(self.ids))
+        self.matrix = (
+            _normalise(matrix) if matrix is not None and len(self.ids) else np.empty((0, 0), dtype=np.float32)
+        )
+        self.path = path
+        self._positions = {sid: i for i, sid in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, speaker_id: str) -> bool:
+        return speaker_id in self._positions
+
+    @classmethod
+    def load(cls, path: Path = INDEX_PATH) -> "SpeakerIndex":
+        if not path.exists():
+            return cls(path=path)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return cls(
+                    ids=[str(i) for i in data["ids"]],
+                    matrix=data["matrix"],
+                    signatures=[str(s) for s in data["signatures"]],
+                    path=path,
+                )
+        except Exception:
+            logger.exception(f"⚠️ Failed to load speaker index {path}, rebuilding")
+            return cls(path=path)
+
+    def save(self, path: Path | None = None) -> None:
+        path = path or self.path
+        if path is None:
+            return
+        # Unique per writer so concurrent processes never share a temp file
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with _lock:
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    ids=np.array(self.ids, dtype=str),
+                    matrix=self.matrix,
+                    signatures=np.array(self.signatures, dtype=str),
+                )
+        os.replace(tmp, path)
+
+    def upsert(self, speaker_id: str, centroid: np.ndarray, signature: str = "") -> None:
+        vec = _normalise(centroid)
+        with _lock:
+            if speaker_id in self._positions:
+                i = self._positions[speaker_id]
+                self.matrix[i] = vec
+                self.signatures[i] = signature
+                return
+            self.matrix = vec[None, :] if len(self.ids) == 0 else np.vstack([self.matrix, vec])
+            self._positions[speaker_id] = len(self.ids)
+            self.ids.append(speaker_id)
+            self.signatures.append(signature)
+
+    def remove(self, speaker_id: str) -> None:
+        with _lock:
+            i = self._positions.pop(speaker_id, None)
+            if i is None:
+                return
+            del self.ids[i]
+            del self.signatures[i]
+            self.matrix = np.delete(self.matrix, i, axis=0)
+            self._positions = {sid: j for j, sid in enumerate(self.ids)}
+
+    def centroid(self, speaker_id: str) -> np.ndarray | None:
+        with _lock:
+            i = self._positions.get(speaker_id)
+            return None if i is None else self.matrix[i].copy()
+
+    def query(self, vectors: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Return ``(ids, distances)`` of the ``k`` nearest speakers per vector.
+
+        Both arrays have shape ``(len(vectors), min(k, len(index)))`` and are
+        sorted by ascending cosine distance.
+        """
+        vectors = _normalise(np.atleast_2d(vectors))
+        # Take a consistent snapshot; upsert/remove replace or edit these
+        with _lock:
+            ids = list(self.ids)
+            matrix = self.matrix.copy()
+        k = min(k, len(ids))
+        if k == 0:
+            return np.empty((len(vectors), 0), dtype=object), np.empty((len(vectors), 0), dtype=np.float32)
+        sims = vectors @ matrix.T
+        if k < len(ids):
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(len(ids)), (len(vectors), 1))
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        distances = 1.0 - np.take_along_axis(top_sims, order, axis=1)
+        return np.array(ids, dtype=object)[top], distances
+
+    def sync(self, conn, compute_missing: bool = True) -> bool:
+        """Bring the index in line with ``speaker_samples``.
+
+        Only speakers whose sample set changed since they were indexed are
+        recomputed.  With ``compute_missing`` false no audio is embedded;
+        centroids built from only some samples stay marked stale so a later
+        computing sync rebuilds them.  Returns ``True`` if anything changed.
+        """
+        with _lock:
+            return self._sync(conn, compute_missing)
+
+    def _sync(self, conn, compute_missing: bool) -> bool:
+        signatures = sample_signatures(conn)
+        changed = False
+        for sid in [sid for sid in self.ids if sid not in signatures]:
+            self.remove(sid)
+            changed = True
+
+        def current(sid, sig):
+            if sid not in self._positions:
+                return False
+            indexed = self.signatures[self._positions[sid]]
+            # A partial centroid is the best a non-computing sync can do
+            return indexed == sig or (not compute_missing and indexed == _PARTIAL + sig)
+
+        stale = {sid: (sig, ids) for sid, (sig, ids) in signatures.items() if not current(sid, sig)}
+        if not stale:
+            return changed
+
+        embeddings = embedding_store.get_embeddings(
+            conn, [seg_id for _, ids in stale.values() for seg_id in ids], compute_missing=compute_missing
+        )
+        refreshed = 0
+        for sid, (sig, ids) in stale.items():
+            embs = [embeddings[i] for i in ids if i in embeddings]
+            if not compute_missing and len(embs) < len(ids):
+                # Some samples have no stored vector yet; a computing sync
+                # sees the partial signature as stale and completes it
+                if embs:
+                    self.upsert(sid, np.mean(embs, axis=0), _PARTIAL + sig)
+                    refreshed += 1
+                continue
+            if embs:
+                self.upsert(sid, np.mean(embs, axis=0), sig)
+            else:
+                self.remove(sid)
+            refreshed += 1
+        if refreshed:
+            logger.info(f"🗂️ Refreshed {refreshed} speaker centroid(s)")
+        return changed or refreshed > 0
+
+
+_index: SpeakerIndex | None = None
+
+
+def load_index(conn, path: Path = INDEX_PATH, compute_missing: bool = True) -> SpeakerIndex:
+    """Return the process-wide index, synced with the database and persisted.
+
+    Request handlers pass ``compute_missing=False`` so they never load the
+    encoder; the pipeline's sync backfills missing embeddings.
+    """
+    global _index
+    with _lock:
+        if _index is None or _index.path != path:
+            _index = SpeakerIndex.load(path)
+        if _index.sync(conn, compute_missing):
+            try:
+                _index.save()
+            except OSError:
+                logger.exception(f"⚠️ Failed to save speaker index {path}")
+        return _index
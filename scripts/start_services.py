@@ -12,7 +12,8 @@ ROOT = Path(__file__).resolve().parents[1]
 def main():
     processes = []
     try:
-        monitor_cmd = [sys.executable, str(ROOT / "scripts" / "monitor.py")]
+        watcher_cmd = [sys.executable, str(ROOT / "scripts" / "job_watcher.py")]
+        workers_cmd = [sys.executable, str(ROOT / "scripts" / "worker_pool.py")]
         dashboard_cmd = [
             "uvicorn",
             "app:app",
@@ -22,9 +23,14 @@ def main():
             "8000",
         ]
 
-        logger.info("Starting monitor...")
+        logger.info("Starting job watcher...")
         processes.append(
-            subprocess.Popen(monitor_cmd, cwd=ROOT / "scripts")
+            subprocess.Popen(watcher_cmd, cwd=ROOT / "scripts")
+        )
+
+        logger.info("Starting pipeline workers...")
+        processes.append(
+            subprocess.Popen(workers_cmd, cwd=ROOT / "scripts")
         )
 
         logger.info("Starting dashboard server...")
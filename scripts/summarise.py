@@ -1,39 +1,46 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from openai import OpenAI
 from common import setup_logging, get_logger
+import llm_client
+from chunking import CHUNK_TOKENS, chunk_text, count_tokens
+from summary_cache import content_key
 
 # === Load environment ===
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 LABELLED_DIR = os.getenv("TRANSCRIPTS_LABELLED")
 SUMMARY_DIR = os.getenv("SUMMARIES")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
 setup_logging()
 logger = get_logger(__name__)
 
 # === Parameters ===
-CHUNK_SIZE = 7000  # characters
-MAX_CHUNKS = 5     # configurable if you want deeper coverage
+MODEL = os.getenv("SUMMARY_MODEL", llm_client.DEFAULT_MODEL)
+# Bump whenever a prompt below changes so cached summaries are regenerated
+PROMPT_VERSION = "2"
 
 # === Utility Functions ===
 
-def split_text_into_chunks(text, max_chars=CHUNK_SIZE):
-    lines = text.splitlines()
-    chunks, current = [], ""
-
-    for line in lines:
-        if len(current) + len(line) + 1 > max_chars:
-            chunks.append(current.strip())
-            current = ""
-        current += line + "\n"
-
-    if current.strip():
-        chunks.append(current.strip())
-
-    return chunks
+def group_for_reduce(summaries, budget=CHUNK_TOKENS):
+    """Group consecutive summaries so each group fits one combine call.
+
+    Every group holds at least two summaries, so each reduce level shrinks
+    the list.
+    """
+    groups, current, size = [], [], 0
+    for summary in summaries:
+        tokens = count_tokens(summary)
+        if len(current) >= 2 and size + tokens > budget:
+            groups.append(current)
+            current, size = [], 0
+        current.append(summary)
+        size += tokens
+    if len(current) == 1 and groups:
+        groups[-1].append(current[0])
+    elif current:
+        groups.append(current)
+    return groups
 
 def list_transcripts_to_process():
     return [
@@ -52,14 +59,28 @@ def save_summary(filename, content):
 
 # === GPT Prompt ===
 
+OUTPUT_INSTRUCTIONS = (
+    "Your job is to:\n"
+    "- Identify whether the conversation is Work or Personal.\n"
+    "- Provide a bullet-point list of actions, decisions, or things to remember.\n"
+    "- Write a concise natural language summary."
+)
+
+def _complete(system_prompt, user_prompt):
+    return llm_client.complete(
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        model=MODEL,
+        temperature=0.5
+    )
+
 def summarise_chunk(chunk):
     system_prompt = (
         "You are an assistant tasked with summarising conversations.\n"
         "The transcript is labelled with real speaker names like 'Jozef' or 'Alex'.\n"
-        "Your job is to:\n"
-        "- Identify whether the conversation is Work or Personal.\n"
-        "- Provide a bullet-point list of actions, decisions, or things to remember.\n"
-        "- Write a concise natural language summary."
+        + OUTPUT_INSTRUCTIONS
     )
 
     user_prompt = (
@@ -67,16 +88,55 @@ def summarise_chunk(chunk):
         + chunk
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.5
+    return _complete(system_prompt, user_prompt)
+
+def combine_summaries(summaries):
+    system_prompt = (
+        "You are an assistant combining summaries of consecutive parts of one conversation "
+        "into a single summary of the whole conversation.\n"
+        "Merge duplicate points and keep every action and decision.\n"
+        + OUTPUT_INSTRUCTIONS
     )
 
-    return response.choices[0].message.content.strip()
+    user_prompt = (
+        "Here are the partial summaries, in order:\n\n"
+        + "\n\n---\n\n".join(summaries)
+    )
+
+    return _complete(system_prompt, user_prompt)
+
+# === Map-reduce ===
+
+def call_key(kind, item):
+    """Cache key for one LLM call over ``item`` (a chunk or a list of summaries)."""
+    text = item if isinstance(item, str) else "\x1e".join(item)
+    return content_key(text, MODEL, PROMPT_VERSION, kind)
+
+def _cached_calls(pool, fn, kind, items, cache):
+    keys = [call_key(kind, item) for item in items]
+    found = cache.get_many(keys) if cache else {}
+    todo = {key: item for key, item in zip(keys, items) if key not in found}
+    fresh = dict(zip(todo, pool.map(fn, todo.values())))
+    if cache and fresh:
+        cache.put_many(fresh)
+    found.update(fresh)
+    return [found[key] for key in keys]
+
+def summarise_chunks(chunks, concurrency=llm_client.CONCURRENCY, cache=None):
+    """Summarise every chunk concurrently, then combine the results.
+
+    Partial summaries are reduced level by level until one remains, so the
+    whole transcript is covered in roughly one round-trip per level.
+    ``cache`` (see ``summary_cache.ChunkCache``) skips calls whose input
+    was summarised before; identical chunks are only sent once either way.
+    """
+    if not chunks:
+        return ""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        summaries = _cached_calls(pool, summarise_chunk, "chunk", chunks, cache)
+        while len(summaries) > 1:
+            summaries = _cached_calls(pool, combine_summaries, "combine", group_for_reduce(summaries), cache)
+    return summaries[0]
 
 # === Main Function ===
 
@@ -92,17 +152,10 @@ def main():
 
         try:
             raw_text = load_transcript(path)
-            chunks = split_text_into_chunks(raw_text)
-            chunks = chunks[:MAX_CHUNKS]
-
-            all_summaries = []
-            for i, chunk in enumerate(chunks):
-                print(f"   ✂️  Summarising chunk {i + 1}/{len(chunks)}...")
-                summary = summarise_chunk(chunk)
-                all_summaries.append(summary)
+            chunks = chunk_text(raw_text)
 
-            # Stitch summaries with context
-            final_summary = "\n\n---\n\n".join(all_summaries)
+            print(f"   ✂️  Summarising {len(chunks)} chunk(s)...")
+            final_summary = summarise_chunks(chunks)
 
             # Optional metadata block
             tag_line = "[Tag: Work or Personal — to be confirmed by review]"
@@ -0,0 +1,100 @@
+"""Content-addressed cache for LLM summaries.
+
+Summaries are keyed by a SHA-256 of their input text, the prompt version and
+the model, so a changed prompt or model never serves stale output.  Whole
+recordings are checked against ``summaries.content_hash`` before anything is
+sent to the LLM; individual chunk and combine calls are cached in
+``summary_chunks`` so a partly edited transcript only re-summarises the
+chunks whose text changed.
+"""
+import hashlib
+import time
+
+from common import setup_logging, get_logger
+
+setup_logging()
+logger = get_logger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+
+def content_key(text: str, model: str, prompt_version: str, kind: str = "recording") -> str:
+    """Hash of ``text`` together with everything that shapes its summary."""
+    digest = hashlib.sha256()
+    for part in (prompt_version, model, kind, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get_summary(conn, recording_id: int, key: str) -> str | None:
+    """The stored summary for ``recording_id`` if it was built from ``key``."""
+    row = conn.execute(
+        "SELECT summary FROM summaries WHERE recording_id = ? AND content_hash = ?",
+        (recording_id, key),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def store_summary(conn, recording_id: int, summary: str, key: str, model: str, prompt_version: str) -> None:
+    """Save a recording summary with its cache key (the caller commits)."""
+    conn.execute(
+        """
+        REPLACE INTO summaries
+            (recording_id, summary, content_hash, model, prompt_version, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (recording_id, summary, key, model, prompt_version, time.time()),
+    )
+
+
+class ChunkCache:
+    """Chunk-level cache passed to ``summarise.summarise_chunks``.
+
+    Lookups and writes happen on the calling thread; each ``put_many``
+    commits so finished chunks survive a failure later in the run.
+    """
+
+    def __init__(self, conn, model: str, prompt_version: str):
+        self.conn = conn
+        self.model = model
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), _QUERY_BATCH):
+            batch = unique[start : start + _QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, summary FROM summary_chunks WHERE key IN ({placeholders})",
+                batch,
+            ).fetchall()
+            found.update((key, summary) for key, summary in rows)
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, str]) -> None:
+        now = time.time()
+        self.conn.executemany(
+            """
+            REPLACE INTO summary_chunks (key, summary, model, prompt_version, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(key, summary, self.model, self.prompt_version, now) for key, summary in items.items()],
+        )
+        self.conn.commit()
+
+
+def prune_stale(conn, model: str, prompt_version: str) -> int:
+    """Drop chunk entries written by other prompts or models."""
+    cur = conn.execute(
+        "DELETE FROM summary_chunks WHERE model IS NOT ? OR prompt_version IS NOT ?",
+        (model, prompt_version),
+    )
+    conn.commit()
+    return cur.rowcount
@@ -1,11 +1,15 @@
 import os
-import sqlite3
 from pathlib import Path
-from pydub import AudioSegment
 from dotenv import load_dotenv
-import whisper
 from common import setup_logging, get_logger
+import asr
+import audio_io
 import vad_split
+import database
+import embedding_store
+import events
+import migrations
+import model_registry
 
 # === Load environment ===
 load_dotenv()
@@ -16,27 +20,50 @@ AUDIO_DIR = Path(os.getenv("AUDIO"))
 SEGMENT_DIR = Path(os.getenv("AUDIO_SEGMENTS", "/mnt/audio/audio_segments")).resolve()
 TRANSCRIPTS_DB = Path(os.getenv("TRANSCRIPTS_DB"))
 
+# Segment WAVs are only needed for playback in the dashboard
+WRITE_SEGMENT_WAVS = os.getenv("WRITE_SEGMENT_WAVS", "1").lower() not in ("0", "false", "no")
+
 SEGMENT_DIR.mkdir(parents=True, exist_ok=True)
 
-# === Load Whisper model ===
-model = whisper.load_model("base")  # or "medium", "small", etc.
+def _embed_segment(samples):
+    """Embed a segment at ingestion so later stages can reuse the vector."""
+    try:
+        return embedding_store.embed_samples(samples, audio_io.SAMPLE_RATE)
+    except Exception:
+        # Speaker identification computes anything missing on demand
+        logger.exception("⚠️ Failed to embed segment")
+        return None
+
+def transcript_id_for(audio_path: Path) -> str:
+    """The ``recordings.datetime`` key of ``audio_path``: ``<date dir>_<stem>``."""
+    parts = audio_path.relative_to(AUDIO_DIR).parts
+    date_part = parts[-2] if len(parts) >= 2 else "unknown"
+    time_part = Path(parts[-1]).stem
+    return f"{date_part}_{time_part}"
 
-def transcribe_and_split(audio_path: Path):
+def is_ingested(conn, audio_path: Path) -> bool:
+    """Whether ``audio_path`` already has a recording, by the key ingestion dedupes on."""
+    try:
+        transcript_id = transcript_id_for(audio_path)
+    except ValueError:
+        return False
+    return conn.execute("SELECT 1 FROM recordings WHERE datetime = ?", (transcript_id,)).fetchone() is not None
+
+def transcribe_and_split(audio_path: Path, progress=None):
     """Transcribe ``audio_path`` and split it into segments.
 
     Returns the ``recording_id`` of the newly inserted row in the
     ``recordings`` table.  ``None`` is returned if the file was skipped or an
-    error occurred.
+    error occurred.  ``progress(stage, done=None, total=None)`` is called as
+    the file moves through decoding, VAD, transcription and embedding.
     """
-    conn = sqlite3.connect(TRANSCRIPTS_DB)
+    report = progress or (lambda stage, done=None, total=None: None)
+    conn = database.get_connection(TRANSCRIPTS_DB)
     cursor = conn.cursor()
     recording_id = None
     try:
         # Extract standard datetime ID from filename
-        parts = audio_path.relative_to(AUDIO_DIR).parts
-        date_part = parts[-2] if len(parts) >= 2 else "unknown"
-        time_part = Path(parts[-1]).stem
-        transcript_id = f"{date_part}_{time_part}"
+        transcript_id = transcript_id_for(audio_path)
 
         # 🔁 Skip if already in DB
         cursor.execute("SELECT 1 FROM recordings WHERE datetime = ?", (transcript_id,))
@@ -45,18 +72,45 @@ def transcribe_and_split(audio_path: Path):
             return None
 
         print(f"🎙️ Transcribing: {audio_path}")
-        audio = AudioSegment.from_file(audio_path)
-        vad_segments = vad_split.split_audio(audio_path, SEGMENT_DIR, prefix=transcript_id)
+        # Decode once; VAD, Whisper and the encoder all work on this array
+        report("decoding")
+        samples = audio_io.load_audio(audio_path)
+        duration = audio_io.probe_duration(audio_path) or len(samples) / audio_io.SAMPLE_RATE
+        report("vad")
+        regions = vad_split.speech_regions(samples)
+
+        segments = []
+        segment_paths = []
+        for i, (start_sec, end_sec) in enumerate(regions):
+            segment = vad_split.region_samples(samples, start_sec, end_sec)
+            segment_path = None
+            if WRITE_SEGMENT_WAVS:
+                segment_path = SEGMENT_DIR / f"{transcript_id}_seg{i:03d}.wav"
+                audio_io.write_wav(segment_path, segment)
+            segments.append(segment)
+            segment_paths.append(segment_path)
 
-        # Insert into recordings table
+        total = len(segments)
+        report("transcribing", 0, total)
+        with model_registry.use("whisper") as model:
+            texts = asr.transcribe_segments(
+                model, segments, progress=lambda done: report("transcribing", done, total)
+            )
+        embeddings = []
+        for segment in segments:
+            embeddings.append(_embed_segment(segment))
+            report("embedding", len(embeddings), total)
+        report("saving")
+
+        # Write everything in one short transaction so concurrent workers
+        # are not blocked while audio is being transcribed
         cursor.execute(
             "INSERT INTO recordings (filename, datetime, duration_sec) VALUES (?, ?, ?)",
-            (audio_path.name, transcript_id, len(audio) / 1000),
+            (audio_path.name, transcript_id, duration),
         )
         recording_id = cursor.lastrowid
 
-        for start_sec, end_sec, segment_path in vad_segments:
-            transcription = model.transcribe(str(segment_path), verbose=False, language="en")
+        for (start_sec, end_sec), segment_path, text, emb in zip(regions, segment_paths, texts, embeddings):
             cursor.execute("""
                 INSERT INTO segments (
                     recording_id, start_time, end_time, speaker_id, transcript, embedding_path
@@ -66,21 +120,34 @@ def transcribe_and_split(audio_path: Path):
                 start_sec,
                 end_sec,
                 None,
-                transcription['text'].strip(),
-                str(segment_path)
+                text,
+                str(segment_path) if segment_path else None
             ))
+            if emb is not None:
+                embedding_store.store_embedding(cursor, cursor.lastrowid, emb, segment_path)
 
+        events.publish(
+            conn,
+            "recording.created",
+            id=recording_id,
+            filename=audio_path.name,
+            datetime=transcript_id,
+            duration_sec=duration,
+            segment_count=len(regions),
+            has_summary=0,
+        )
+        events.publish(conn, "segments.created", recording_id=recording_id, count=len(regions))
         conn.commit()
         logger.info(f"✅ Completed: {transcript_id}")
         return recording_id
 
     except Exception:
         logger.exception(f"❌ Failed to process {audio_path.name}")
+        conn.rollback()
         return None
-    finally:
-        conn.close()
 
 def main():
+    migrations.migrate(database.get_connection(TRANSCRIPTS_DB))
     audio_files = list(AUDIO_DIR.rglob("*.m4a"))
     logger.info(f"🔍 Found {len(audio_files)} file(s) in {AUDIO_DIR}")
 
@@ -4,53 +4,58 @@ from pathlib import Path
 from typing import List, Tuple
 
 import numpy as np
-from pydub import AudioSegment
 
 from common import setup_logging, get_logger
+import audio_io
+import model_registry
 
 setup_logging()
 logger = get_logger(__name__)
 
-# Try to load Silero VAD via torch.hub. Fallback to webrtcvad if unavailable.
-try:  # pragma: no cover - best effort import
-    import torch
+SAMPLE_RATE = audio_io.SAMPLE_RATE
 
-    silero_model, utils = torch.hub.load(
-        "snakers4/silero-vad", "silero_vad", trust_repo=True
-    )
-    get_speech_timestamps, *_ = utils
-    USE_SILERO = True
-except Exception:  # pragma: no cover
-    USE_SILERO = False
-    torch = None
-    import webrtcvad
+_silero_unavailable = False
+
+
+def _get_silero():
+    """Return ``(model, get_speech_timestamps)``, or ``None`` to use webrtcvad."""
+    global _silero_unavailable
+    if _silero_unavailable:
+        return None
+    try:  # pragma: no cover - best effort import
+        model, utils = model_registry.get("silero_vad")
+        return model, utils[0]
+    except Exception:  # pragma: no cover
+        logger.warning("⚠️ Silero VAD unavailable, falling back to webrtcvad")
+        _silero_unavailable = True
+        return None
 
 
-def _detect_silero(audio: AudioSegment) -> List[Tuple[float, float]]:
+def _detect_silero(samples: np.ndarray, silero) -> List[Tuple[float, float]]:
     """Return raw speech timestamps using Silero VAD."""
-    # Ensure 16 kHz mono
-    audio = audio.set_frame_rate(16000).set_channels(1)
-    samples = np.array(audio.get_array_of_samples()).astype(np.float32) / 32768.0
-    tensor = torch.from_numpy(samples)
-    timestamps = get_speech_timestamps(tensor, silero_model, sampling_rate=16000)
-    return [(ts["start"] / 16000.0, ts["end"] / 16000.0) for ts in timestamps]
+    import torch
+
+    silero_model, get_speech_timestamps = silero
+    tensor = torch.from_numpy(np.ascontiguousarray(samples, dtype=np.float32))
+    timestamps = get_speech_timestamps(tensor, silero_model, sampling_rate=SAMPLE_RATE)
+    return [(ts["start"] / SAMPLE_RATE, ts["end"] / SAMPLE_RATE) for ts in timestamps]
 
 
-def _detect_webrtc(audio: AudioSegment) -> List[Tuple[float, float]]:
+def _detect_webrtc(samples: np.ndarray) -> List[Tuple[float, float]]:
     """Return raw speech timestamps using webrtcvad."""
-    audio = audio.set_frame_rate(16000).set_channels(1)
-    sample_rate = audio.frame_rate
+    import webrtcvad
+
     vad = webrtcvad.Vad(2)
     frame_ms = 30
-    frame_bytes = int(sample_rate * frame_ms / 1000) * audio.sample_width
-    raw = audio.raw_data
+    frame_bytes = int(SAMPLE_RATE * frame_ms / 1000) * 2
+    raw = audio_io.to_pcm16(samples)
     num_frames = len(raw) // frame_bytes
     segments: List[Tuple[float, float]] = []
     start = None
     frame_duration = frame_ms / 1000.0
     for i in range(num_frames):
         frame = raw[i * frame_bytes : (i + 1) * frame_bytes]
-        is_speech = vad.is_speech(frame, sample_rate)
+        is_speech = vad.is_speech(frame, SAMPLE_RATE)
         t = i * frame_duration
         if is_speech:
             if start is None:
@@ -77,26 +82,39 @@ def _merge_segments(segments: List[Tuple[float, float]], max_gap: float = 0.2) -
     return merged
 
 
+def speech_regions(samples: np.ndarray, pad: float = 0.1) -> List[Tuple[float, float]]:
+    """Return padded ``(start_sec, end_sec)`` speech regions of 16 kHz ``samples``."""
+    duration = len(samples) / SAMPLE_RATE
+    silero = _get_silero()
+    if silero:
+        with model_registry.use("silero_vad"):
+            raw_segments = _detect_silero(samples, silero)
+    else:
+        raw_segments = _detect_webrtc(samples)
+    return [
+        (max(0.0, start - pad), min(duration, end + pad))
+        for start, end in _merge_segments(raw_segments)
+    ]
+
+
+def region_samples(samples: np.ndarray, start: float, end: float) -> np.ndarray:
+    """Slice of ``samples`` between ``start`` and ``end`` seconds (a view, not a copy)."""
+    return samples[int(start * SAMPLE_RATE) : int(end * SAMPLE_RATE)]
+
+
 def split_audio(input_path: Path, out_dir: Path, prefix: str | None = None) -> List[Tuple[float, float, Path]]:
     """Split ``input_path`` into speech segments using VAD.
 
     Returns a list of (start_sec, end_sec, segment_path).
     """
-    audio = AudioSegment.from_file(input_path)
-    duration = len(audio) / 1000.0
-    raw_segments = _detect_silero(audio) if USE_SILERO else _detect_webrtc(audio)
-    merged = _merge_segments(raw_segments)
-
+    samples = audio_io.load_audio(input_path)
     results: List[Tuple[float, float, Path]] = []
     out_dir.mkdir(parents=True, exist_ok=True)
     base = prefix or input_path.stem
-    for i, (start, end) in enumerate(merged):
-        start_pad = max(0.0, start - 0.1)
-        end_pad = min(duration, end + 0.1)
-        segment_audio = audio[int(start_pad * 1000) : int(end_pad * 1000)]
+    for i, (start, end) in enumerate(speech_regions(samples)):
         segment_path = out_dir / f"{base}_seg{i:03d}.wav"
-        segment_audio.export(segment_path, format="wav")
-        results.append((start_pad, end_pad, segment_path))
+        audio_io.write_wav(segment_path, region_samples(samples, start, end))
+        results.append((start, end, segment_path))
     return results
 
 
@@ -0,0 +1,148 @@
+"""Multi-process pipeline worker pool.
+
+Runs ``PIPELINE_WORKERS`` worker processes.  Each loads its models once and
+then loops leasing due rows from the ``jobs`` table (see ``job_queue``) and running
+transcription, speaker identification and summarisation on them.  Torch
+intra-op threads are split between workers to avoid oversubscription.
+"""
+import multiprocessing as mp
+import os
+import signal
+from pathlib import Path
+
+import requests
+from dotenv import load_dotenv
+
+from common import setup_logging, get_logger
+import database
+import job_queue
+import migrations
+
+load_dotenv()
+setup_logging()
+logger = get_logger(__name__)
+
+DB_PATH = os.getenv("TRANSCRIPTS_DB")
+WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+# 0 splits the available cores evenly between workers
+TORCH_THREADS = int(os.getenv("WORKER_TORCH_THREADS", "0"))
+API_URL = os.getenv("PIPELINE_API_URL", "http://127.0.0.1:8000")
+POLL_INTERVAL = 5  # seconds
+
+
+def _threads_per_worker() -> int:
+    if TORCH_THREADS > 0:
+        return TORCH_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, WORKERS))
+
+
+def run_pipeline(file_path: str, progress=None) -> int | None:
+    """Transcribe, identify speakers and request a summary for one file."""
+    from transcribe_and_split import transcribe_and_split
+    import speaker_identification
+
+    report = progress or (lambda stage, done=None, total=None: None)
+    recording_id = transcribe_and_split(Path(file_path).resolve(), progress=report)
+    if recording_id is None:
+        return None
+
+    logger.info(f"🧠 Identifying speakers for recording {recording_id}...")
+    report("speakers")
+    speaker_identification.main(recording_id)
+
+    logger.info(f"📝 Requesting summarisation for recording {recording_id}...")
+    report("summarising")
+    try:
+        resp = requests.post(f"{API_URL}/api/recordings/{recording_id}/summarize")
+        resp.raise_for_status()
+    except requests.RequestException:
+        # The transcript is stored; the summary can be requested again later
+        logger.exception(f"⚠️ Summarisation failed for recording {recording_id}")
+    return recording_id
+
+
+def worker_main(index: int, stop) -> None:
+    """Entry point of a worker process."""
+    # The parent handles Ctrl-C and tells workers to stop between jobs
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    threads = _threads_per_worker()
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except Exception:
+        pass
+
+    import model_registry
+    from transcribe_and_split import is_ingested
+
+    model_registry.warm_up(["whisper", "silero_vad", "voice_encoder"])
+    logger.info(f"👷 Worker {index} ready ({threads} thread(s))")
+
+    worker_id = job_queue.default_worker_id()
+    conn = database.connect(DB_PATH)
+    migrations.migrate(conn)
+    try:
+        while not stop.is_set():
+            job = job_queue.claim(conn, worker_id)
+            if job is None:
+                stop.wait(POLL_INTERVAL)
+                continue
+            job_id, file_path, attempts = job
+            logger.info(f"🔁 Worker {index} processing job {job_id} (attempt {attempts}): {file_path}")
+            error = None
+            try:
+                with job_queue.lease(DB_PATH, job_id, worker_id) as report:
+                    recording_id = run_pipeline(file_path, report)
+                if recording_id is None and not is_ingested(conn, Path(file_path).resolve()):
+                    error = "Transcription failed"
+            except Exception as exc:
+                logger.exception(f"❌ Job {job_id} failed")
+                error = str(exc) or type(exc).__name__
+            if error is None:
+                job_queue.complete(conn, job_id, worker_id)
+                logger.info(f"✅ Job {job_id} completed")
+            else:
+                status = job_queue.fail(conn, job_id, worker_id, error)
+                logger.info(f"❌ Job {job_id} failed, now {status}")
+    finally:
+        conn.close()
+
+
+def main():
+    if not DB_PATH:
+        raise RuntimeError("TRANSCRIPTS_DB must be set in the environment")
+
+    ctx = mp.get_context("spawn")
+    stop = ctx.Event()
+
+    def _shutdown(signum, frame):
+        logger.info("Stopping workers...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    workers: dict[int, mp.Process] = {}
+    logger.info(f"🚀 Starting {WORKERS} pipeline worker(s)")
+    while not stop.is_set():
+        for i in range(WORKERS):
+            proc = workers.get(i)
+            if proc is None or not proc.is_alive():
+                if proc is not None:
+                    logger.warning(f"⚠️ Worker {i} exited with {proc.exitcode}, restarting")
+                proc = ctx.Process(target=worker_main, args=(i, stop), daemon=True)
+                proc.start()
+                workers[i] = proc
+        stop.wait(POLL_INTERVAL)
+
+    for proc in workers.values():
+        proc.join(timeout=60)
+        if proc.is_alive():
+            proc.terminate()
+
+
+if __name__ == "__main__":
+    main()